@@ -0,0 +1,5 @@
+#! /bin/bash -x
+
+set -e
+
+docker-compose exec router01 sh -c "mongosh --port 27017 --quiet < /scripts/shard-keys.js"
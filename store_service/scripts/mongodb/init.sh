@@ -11,8 +11,8 @@ docker-compose exec router01 sh -c "mongosh < /scripts/init-router.js"
 docker-compose exec router01 mongosh --port 27017 --eval 'sh.enableSharding("app")'
 docker-compose exec router01 mongosh --port 27017 --eval '
 sh.enableSharding("app"),
-db.adminCommand( { shardCollection: "app.Order", key: { _id: 1 } } ),
-db.adminCommand( { shardCollection: "app.OrderProduct", key: { _id: 1 } } )
+db.adminCommand( { shardCollection: "app.Order", key: { user_id: "hashed" } } ),
+db.adminCommand( { shardCollection: "app.OrderProduct", key: { order_id: "hashed" } } )
 '
 
 
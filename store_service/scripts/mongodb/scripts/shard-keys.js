@@ -0,0 +1,41 @@
+// Compares the shard keys of init.sh on a scratch `shardtest` database:
+// routing of the hot queries (SINGLE_SHARD is targeted, SHARD_MERGE is a
+// broadcast) and how the inserts spread over the shards.
+const test = db.getSiblingDB("shardtest")
+test.dropDatabase()
+sh.enableSharding("shardtest")
+sh.shardCollection("shardtest.OrderRanged", { _id: 1 })
+sh.shardCollection("shardtest.Order", { user_id: "hashed" })
+sh.shardCollection("shardtest.OrderProduct", { order_id: "hashed" })
+
+const userCount = 200
+const orderCount = 5000
+const orders = Array.from({ length: orderCount }, (_, i) => ({
+    _id: new ObjectId(),
+    status: i % 10 ? "completed" : "pending",
+    user_id: "user" + (i % userCount),
+    updated_at: new Date(),
+}))
+test.OrderRanged.insertMany(orders)
+test.Order.insertMany(orders)
+test.OrderProduct.insertMany(
+    orders.flatMap((x) => [
+        { order_id: x._id, product_id: new ObjectId() },
+        { order_id: x._id, product_id: new ObjectId() },
+    ])
+)
+
+function route(explain) {
+    const plan = explain.queryPlanner.winningPlan
+    return plan.stage + " " + JSON.stringify((plan.shards || []).map((x) => x.shardName))
+}
+
+print("Order.find({user_id, status}):  " + route(test.Order.find({ user_id: "user1", status: "pending" }).explain()))
+print("Order.find({_id}):              " + route(test.Order.find({ _id: orders[0]._id }).explain()))
+print("OrderProduct.find({order_id}):  " + route(test.OrderProduct.find({ order_id: orders[0]._id }).explain()))
+print("OrderRanged.find({user_id}):    " + route(test.OrderRanged.find({ user_id: "user1" }).explain()))
+
+for (const name of ["OrderRanged", "Order", "OrderProduct"]) {
+    print("\n" + name)
+    test.getCollection(name).getShardDistribution()
+}
@@ -10,4 +10,6 @@ prisma generate
 
 prisma db push
 
+python ./store_service/create_indexes.py
+
 pytest /app/store_service/test -vv --tb=no -l --cov /app/store_service --cov-report=html
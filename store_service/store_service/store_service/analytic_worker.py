@@ -0,0 +1,33 @@
+import asyncio
+
+from loguru import logger
+from prisma import Prisma
+
+
+async def work() -> None:
+    from store_service.core.config import get_app_settings
+    from store_service.db.base import dbapp
+    from store_service.services.analytics import jobs
+
+    prisma = Prisma(auto_register=True)
+    await prisma.connect()
+    try:
+        await jobs.work(
+            dbapp,
+            concurrency=get_app_settings().ANALYTIC_WORKER_CONCURRENCY,
+            poll_interval_sec=get_app_settings().ANALYTIC_WORKER_POLL_INTERVAL_SEC,
+            timeout_sec=get_app_settings().ANALYTIC_JOB_TIMEOUT_SEC,
+            max_attempts=get_app_settings().ANALYTIC_JOB_MAX_ATTEMPTS,
+        )
+    finally:
+        if prisma.is_connected():
+            await prisma.disconnect()
+
+
+def main() -> None:
+    logger.warning("Starting analytic worker")
+    asyncio.run(work())
+
+
+if __name__ == "__main__":
+    main()
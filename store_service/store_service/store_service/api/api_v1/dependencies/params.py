@@ -3,6 +3,7 @@ from collections.abc import Callable
 from json import JSONDecodeError
 from typing import Optional, Any
 
+from bson import ObjectId
 from fastapi import HTTPException
 from fastapi import Query
 from pydantic import BaseModel, Field
@@ -24,6 +25,7 @@ def parse_query_params(
     where_example: Any = None,
     range_description: str = "",
     where_add_description: str = "",
+    default_take: int | None = 50,
 ) -> Callable[[str | None, str | None], RequestParams]:
     def inner(
         range_: Optional[str] = Query(
@@ -51,8 +53,8 @@ def parse_query_params(
         ),
     ):
         try:
-            skip, limit = 0, 50
-            if range_:
+            skip, limit = (0, default_take) if use_range else (None, None)
+            if range_ and use_range:
                 start, end = json.loads(range_)
                 if end is None:
                     skip, limit = start, None
@@ -96,3 +98,56 @@ def parse_query_params(
         return RequestParams(**_rp)
 
     return inner
+
+
+mongo_filter_operators = {
+    "equals": "$eq",
+    "not": "$ne",
+    "in": "$in",
+    "not_in": "$nin",
+    "lt": "$lt",
+    "lte": "$lte",
+    "gt": "$gt",
+    "gte": "$gte",
+}
+
+
+# `*_id` fields stored as plain strings rather than `@db.ObjectId`.
+string_id_fields = {"user_id"}
+
+
+def object_id(value: Any) -> Any:
+    """`value` as an ObjectId if it is the string of one, list items too."""
+    if isinstance(value, list):
+        return [object_id(x) for x in value]
+    if isinstance(value, str) and ObjectId.is_valid(value):
+        return ObjectId(value)
+    return value
+
+
+def mongo_filter(where: dict | None) -> dict:
+    """Translate a prisma `where` produced by `parse_query_params` into a
+    raw MongoDB filter for use in aggregation pipelines. Values of `id` and
+    of the `*_id` ObjectId fields are converted to ObjectIds."""
+    _filter = {}
+    for k, v in (where or {}).items():
+        field = "_id" if k == "id" else k
+        convert = field.endswith("_id") and field not in string_id_fields
+        if not isinstance(v, dict):
+            _filter.update({field: object_id(v) if convert else v})
+            continue
+        condition = {}
+        for op, value in v.items():
+            if op not in mongo_filter_operators:
+                raise HTTPException(
+                    400, f"Unsupported where operator '{k}': '{op}'"
+                )
+            condition.update(
+                {
+                    mongo_filter_operators[op]: object_id(value)
+                    if convert
+                    else value
+                }
+            )
+        _filter.update({field: condition})
+    return _filter
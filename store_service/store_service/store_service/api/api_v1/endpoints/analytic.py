@@ -1,59 +1,50 @@
-import time
 from datetime import datetime
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException
 from fastapi.params import Param
 from prisma.enums import OrderStatus
-from prisma.models import Order, OrderProduct, Category
-from pydantic import BaseModel
+from starlette import status
+from starlette.responses import StreamingResponse
 
 from store_service.api.api_v1.dependencies import params
 from store_service.api.api_v1.dependencies.auth import RoleChecker
 from store_service.api.api_v1.dependencies.params import RequestParams
+from store_service.core.config import get_app_settings
+from store_service.db.base import dbanalytic, dbapp
+from store_service.db.indexes import index_stats
+from store_service.schemas.analytic import (
+    AnalyticEngine,
+    AnalyticJob,
+    AnalyticJobCreate,
+    AnalyticResponse,
+    ExportFormat,
+    Granularity,
+    QuantitySoldCategory,
+    ReportFormat,
+    SalesRevenue,
+    SalesTimeseries,
+    TopBy,
+    TopEntity,
+    TopRanking,
+)
+from store_service.services.analytics import export, jobs
+from store_service.services.analytics.cache import (
+    reports_cache,
+    report_key,
+    round_datetime,
+)
+from store_service.services.analytics.reports import (
+    cached_response,
+    categories_sales_report,
+    sales_revenue_ndjson,
+    sales_revenue_report,
+    sales_timeseries_report,
+    top_report,
+)
 
 router = APIRouter()
 
 
-class AnalyticResponse(BaseModel):
-    request_params: RequestParams
-    report: dict | None
-    elapsed_time_sec: float | int | None
-    details: dict | None
-
-
-class SalesRevenue(BaseModel):
-    analytic_response: dict | AnalyticResponse
-    order_count: int | None
-    revenue: float | None
-    products: list[dict] | None
-
-
-async def get_orders_for_period(
-    start_datetime: datetime,
-    end_datetime: datetime,
-    request_params: RequestParams,
-):
-    cost = {"cost": True}
-    orders_for_period = await Order.prisma().group_by(
-        ["id"],
-        sum=cost,
-        having={
-            "updated_at": {
-                "_min": {"gt": start_datetime},
-                "_max": {"lt": end_datetime},
-            }
-        },
-        order={"id": "asc"},
-        **request_params.dict(exclude_none=True),
-    )
-    order_ids = list(map(lambda x: x.get("id"), orders_for_period))
-    orders_products = await OrderProduct.prisma().find_many(
-        where={"order_id": {"in": order_ids}},
-        include={"order": True, "product": True},
-    )
-    return orders_products
-
-
 @router.get(
     "/sales",
     response_model=SalesRevenue,
@@ -70,70 +61,86 @@ async def sales_analytics(
     show_products: bool = Param(True, description="list of `products`"),
     show_product_orders: bool = Param(False, description="field `in_orders`"),
     show_product_buyers: bool = Param(False, description="field `buyers`"),
+    approx: bool = Param(
+        False,
+        description="estimate `buyers` from the HyperLogLog sketches of engine `rollup`",
+    ),
+    engine: AnalyticEngine = Param(
+        AnalyticEngine.aggregation,
+        description="`aggregation` computes the report inside MongoDB, `rollup` reads the daily `SalesRollup` counters",
+    ),
+    format_: ReportFormat = Param(
+        ReportFormat.json,
+        alias="format",
+        description="`ndjson` streams the summary followed by one line per product",
+    ),
     request_params: RequestParams = Depends(
         params.parse_query_params(
             use_order=False,
             order_example=None,
-            range_description="Explanation: The range applicable for the 'Order' collection.",
+            range_description="Explanation: The range applicable for the 'Order' collection, every order of the period if not set. Not supported by engine `rollup`.",
+            default_take=None,
             where_example='{"status": "completed"}',
             where_add_description=f"""available statuses: `{[x.name for x in OrderStatus]}`""",
         )
     ),
 ) -> SalesRevenue:
-    start = time.time()
-    orders_products = await get_orders_for_period(
-        start_datetime, end_datetime, request_params
-    )
-    orders_product_users = [x.order.user_id for x in orders_products]
-    revenue = sum([x.product.price for x in orders_products])
-    products_in_order_products = (
-        [
-            {
-                "product": x.product.id,
-                "in_orders": {y.order_id for y in orders_products}
-                if show_product_orders
-                else None,
-                "buyers": {
-                    "customers": {
-                        "ids": {
-                            y.order.user_id
-                            for y in orders_products
-                            if y.product_id == x.product_id
-                        }
-                    }
-                }
-                if show_product_buyers
-                else None,
-            }
-            for x in orders_products
-        ]
-        if show_products
-        else []
-    )
-    end = time.time()
-    analytic_response = AnalyticResponse(
-        request_params=request_params,
-        report={
-            "start_datetime": start_datetime,
-            "end_datetime": end_datetime,
-            "created_at": datetime.now(),
-        },
-        elapsed_time_sec=f"{end - start:0.5f}",
-        details={"product_count": len(products_in_order_products)},
+    if format_ == ReportFormat.ndjson:
+        if engine != AnalyticEngine.aggregation:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"format {format_.name} requires engine {AnalyticEngine.aggregation.name}",
+            )
+        if approx:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"format {format_.name} does not support approx",
+            )
+        # Invalid filters fail here, before the stream sends its 200.
+        params.mongo_filter(request_params.where)
+        return StreamingResponse(
+            sales_revenue_ndjson(
+                start_datetime,
+                end_datetime,
+                request_params,
+                show_products=show_products,
+                show_product_orders=show_product_orders,
+                show_product_buyers=show_product_buyers,
+            ),
+            media_type="application/x-ndjson",
+        )
+    start_datetime = round_datetime(start_datetime)
+    end_datetime = round_datetime(end_datetime)
+    sales_revenue, cache_hit, age = await reports_cache.get_or_compute(
+        report_key(
+            "sales",
+            request_params,
+            start_datetime=start_datetime,
+            end_datetime=end_datetime,
+            show_products=show_products,
+            show_product_orders=show_product_orders,
+            show_product_buyers=show_product_buyers,
+            approx=approx,
+            engine=engine,
+        ),
+        lambda: sales_revenue_report(
+            start_datetime,
+            end_datetime,
+            request_params,
+            show_products=show_products,
+            show_product_orders=show_product_orders,
+            show_product_buyers=show_product_buyers,
+            approx=approx,
+            engine=engine,
+        ),
     )
-    _sales_revenue = SalesRevenue(
-        analytic_response=analytic_response,
-        products=products_in_order_products,
-        order_count=len({x.order_id for x in orders_products}),
-        revenue=revenue,
+    return sales_revenue.copy(
+        update={
+            "analytic_response": cached_response(
+                sales_revenue.analytic_response, cache_hit, age
+            )
+        }
     )
-    return _sales_revenue
-
-
-class QuantitySoldCategory(BaseModel):
-    category_id: str | None
-    category: dict | None
-    quantity_sold_products_by_status: int | None
 
 
 @router.get(
@@ -150,52 +157,249 @@ async def categories_sales_analytic(
         datetime.now(), description="ISO 8601 format"
     ),
     verbose: bool = Param(False, description="show `category` collection"),
+    approx: bool = Param(
+        False,
+        description="estimated distinct `buyers` from the HyperLogLog sketches of engine `rollup`",
+    ),
+    engine: AnalyticEngine = Param(
+        AnalyticEngine.aggregation,
+        description="`aggregation` computes the report inside MongoDB, `rollup` reads the daily `SalesRollup` counters",
+    ),
     request_params: RequestParams = Depends(
         params.parse_query_params(
             use_order=False,
             order_example=None,
-            range_description="Explanation: The range applicable for the 'Order' collection.",
+            range_description="Explanation: The range applicable for the 'Order' collection, every order of the period if not set. Not supported by engine `rollup`.",
+            default_take=None,
             where_example='{"status": "completed"}',
             where_add_description=f"""`status`=`{[x.name for x in OrderStatus]}`""",
         )
     ),
 ) -> dict[str, AnalyticResponse | list[QuantitySoldCategory]]:
-    start = time.time()
-    orders_products = await get_orders_for_period(
-        start_datetime, end_datetime, request_params
+    start_datetime = round_datetime(start_datetime)
+    end_datetime = round_datetime(end_datetime)
+    report, cache_hit, age = await reports_cache.get_or_compute(
+        report_key(
+            "sales/category",
+            request_params,
+            start_datetime=start_datetime,
+            end_datetime=end_datetime,
+            verbose=verbose,
+            approx=approx,
+            engine=engine,
+        ),
+        lambda: categories_sales_report(
+            start_datetime,
+            end_datetime,
+            request_params,
+            verbose=verbose,
+            approx=approx,
+            engine=engine,
+        ),
     )
-    sold_product_category_ids = {
-        x.product.category_id for x in orders_products
+    return {
+        **report,
+        "analytic_response": cached_response(
+            report["analytic_response"], cache_hit, age
+        ),
     }
 
-    end = time.time()
-    analytic_response = AnalyticResponse(
-        request_params=request_params,
-        report={
-            "start_datetime": start_datetime,
-            "end_datetime": end_datetime,
-            "created_at": datetime.now(),
-        },
-        elapsed_time_sec=f"{end - start}",
-        details={"category_count": len(sold_product_category_ids)},
+
+@router.get(
+    "/sales/timeseries",
+    response_model=SalesTimeseries,
+    dependencies=[Depends(RoleChecker(["admin"]))],
+)
+async def sales_timeseries_analytic(
+    start_datetime: datetime = Param(
+        datetime.now().replace(year=datetime.now().year - 1),
+        description="ISO 8601 format",
+    ),
+    end_datetime: datetime = Param(
+        datetime.now(), description="ISO 8601 format"
+    ),
+    granularity: Granularity = Param(
+        Granularity.day, description="bucket of `Order.updated_at`"
+    ),
+    engine: AnalyticEngine = Param(
+        AnalyticEngine.aggregation,
+        description="`aggregation` computes the report inside MongoDB, `rollup` reads the daily `SalesRollup` counters",
+    ),
+    request_params: RequestParams = Depends(
+        params.parse_query_params(
+            use_range=False,
+            use_order=False,
+            order_example=None,
+            where_example='{"status": "completed"}',
+            where_add_description=f"""`status`=`{[x.name for x in OrderStatus]}`""",
+        )
+    ),
+) -> SalesTimeseries:
+    start_datetime = round_datetime(start_datetime)
+    end_datetime = round_datetime(end_datetime)
+    timeseries, cache_hit, age = await reports_cache.get_or_compute(
+        report_key(
+            "sales/timeseries",
+            request_params,
+            start_datetime=start_datetime,
+            end_datetime=end_datetime,
+            granularity=granularity,
+            engine=engine,
+        ),
+        lambda: sales_timeseries_report(
+            start_datetime,
+            end_datetime,
+            request_params,
+            granularity=granularity,
+            engine=engine,
+        ),
     )
-    quantity_sold_category = {
-        "analytic_response": analytic_response,
-        "categories": [
-            QuantitySoldCategory(
-                category_id=x,
-                category=await Category.prisma().find_unique(where={"id": x})
-                if verbose
-                else None,
-                quantity_sold_products_by_status=len(
-                    {
-                        y.order_id
-                        for y in orders_products
-                        if y.product.category_id == x
-                    }
-                ),
+    return timeseries.copy(
+        update={
+            "analytic_response": cached_response(
+                timeseries.analytic_response, cache_hit, age
             )
-            for x in sold_product_category_ids
-        ],
-    }
-    return quantity_sold_category
+        }
+    )
+
+
+@router.get(
+    "/top",
+    response_model=TopRanking,
+    dependencies=[Depends(RoleChecker(["admin"]))],
+)
+async def top_analytic(
+    start_datetime: datetime = Param(
+        datetime.now().replace(year=datetime.now().year - 1),
+        description="ISO 8601 format",
+    ),
+    end_datetime: datetime = Param(
+        datetime.now(), description="ISO 8601 format"
+    ),
+    by: TopBy = Param(TopBy.revenue),
+    entity: TopEntity = Param(TopEntity.product),
+    limit: int = Param(10, ge=1, le=1000),
+    engine: AnalyticEngine = Param(
+        AnalyticEngine.aggregation,
+        description="`aggregation` computes the report inside MongoDB, `rollup` reads the daily `SalesRollup` counters",
+    ),
+    request_params: RequestParams = Depends(
+        params.parse_query_params(
+            use_range=False,
+            use_order=False,
+            order_example=None,
+            where_example='{"status": "completed"}',
+            where_add_description=f"""`status`=`{[x.name for x in OrderStatus]}`""",
+        )
+    ),
+) -> TopRanking:
+    start_datetime = round_datetime(start_datetime)
+    end_datetime = round_datetime(end_datetime)
+    ranking, cache_hit, age = await reports_cache.get_or_compute(
+        report_key(
+            "top",
+            request_params,
+            start_datetime=start_datetime,
+            end_datetime=end_datetime,
+            by=by,
+            entity=entity,
+            limit=limit,
+            engine=engine,
+        ),
+        lambda: top_report(
+            start_datetime,
+            end_datetime,
+            request_params,
+            by=by,
+            entity=entity,
+            limit=limit,
+            engine=engine,
+        ),
+    )
+    return ranking.copy(
+        update={
+            "analytic_response": cached_response(
+                ranking.analytic_response, cache_hit, age
+            )
+        }
+    )
+
+
+@router.get(
+    "/export",
+    response_class=StreamingResponse,
+    dependencies=[Depends(RoleChecker(["admin"]))],
+)
+async def export_analytic(
+    start_datetime: datetime = Param(
+        datetime.now().replace(year=datetime.now().year - 1),
+        description="ISO 8601 format",
+    ),
+    end_datetime: datetime = Param(
+        datetime.now(), description="ISO 8601 format"
+    ),
+    format_: ExportFormat = Param(
+        ExportFormat.parquet,
+        alias="format",
+        description="one row per order line, encoded in record batches: `arrow` is the Arrow IPC stream format",
+    ),
+    request_params: RequestParams = Depends(
+        params.parse_query_params(
+            use_order=False,
+            order_example=None,
+            range_description="Explanation: The range applicable for the 'Order' collection, every order of the period if not set.",
+            default_take=None,
+            where_example='{"status": "completed"}',
+            where_add_description=f"""`status`=`{[x.name for x in OrderStatus]}`""",
+        )
+    ),
+) -> StreamingResponse:
+    # Invalid filters fail here, before the stream sends its 200.
+    params.mongo_filter(request_params.where)
+    return StreamingResponse(
+        export.encode(
+            export.iter_record_batches(
+                dbanalytic,
+                start_datetime,
+                end_datetime,
+                request_params,
+                get_app_settings().ANALYTIC_STREAM_BATCH_SIZE,
+            ),
+            format_,
+        ),
+        media_type=export.media_types[format_],
+        headers={
+            "Content-Disposition": f'attachment; filename="order_lines.{format_.value}"'
+        },
+    )
+
+
+@router.get(
+    "/indexes",
+    response_model=list[dict],
+    dependencies=[Depends(RoleChecker(["admin"]))],
+)
+async def read_index_stats() -> list[dict]:
+    return await index_stats(dbapp)
+
+
+@router.post(
+    "/jobs",
+    response_model=AnalyticJob,
+    status_code=status.HTTP_202_ACCEPTED,
+    dependencies=[Depends(RoleChecker(["admin"]))],
+)
+async def create_analytic_job(job_in: AnalyticJobCreate) -> AnalyticJob:
+    return await jobs.enqueue(dbapp, job_in)
+
+
+@router.get(
+    "/jobs/{id}",
+    response_model=AnalyticJob,
+    dependencies=[Depends(RoleChecker(["admin"]))],
+)
+async def read_analytic_job(id: str) -> AnalyticJob:
+    job = await jobs.get(dbapp, id)
+    if not job:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    return job
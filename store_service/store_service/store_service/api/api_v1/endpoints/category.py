@@ -12,6 +12,12 @@ from starlette import status
 from store_service.api.api_v1.dependencies import params
 from store_service.api.api_v1.dependencies.auth import RoleChecker
 from store_service.api.api_v1.dependencies.params import RequestParams
+from store_service.services.catalog import (
+    cached,
+    catalog_cache,
+    catalog_key,
+    category_ids,
+)
 
 router = APIRouter()
 
@@ -26,8 +32,11 @@ router = APIRouter()
 async def read_categories(
     request_params: RequestParams = Depends(params.parse_query_params()),
 ) -> list[Category]:
-    category = await Category.prisma().find_many(
-        **request_params.dict(exclude_none=True)
+    category = await cached(
+        catalog_key("categories", request_params),
+        lambda: Category.prisma().find_many(
+            **request_params.dict(exclude_none=True)
+        ),
     )
     return category
 
@@ -39,6 +48,8 @@ async def read_categories(
 )
 async def create_category(category_in: CategoryCreate) -> Optional[Category]:
     category = await Category.prisma().create(category_in.dict())
+    catalog_cache.invalidate()
+    category_ids.set(category.name, category.id)
     return category
 
 
@@ -52,7 +63,10 @@ async def create_category(category_in: CategoryCreate) -> Optional[Category]:
 async def read_category_by_id(
     id: str,
 ) -> Category | None:
-    category = await Category.prisma().find_unique(where={"id": id})
+    category = await cached(
+        catalog_key("categories/id", id=id),
+        lambda: Category.prisma().find_unique(where={"id": id}),
+    )
     return category
 
 
@@ -64,12 +78,15 @@ async def read_category_by_id(
 async def update_category(
     id: str, category_in: CategoryUpdate
 ) -> Optional[Category]:
-    return await Category.prisma().update(
+    category = await Category.prisma().update(
         where={
             "id": id,
         },
         data=category_in.dict(),
     )
+    catalog_cache.invalidate()
+    category_ids.invalidate()
+    return category
 
 
 @router.delete(
@@ -85,4 +102,6 @@ async def delete_category(id: str) -> dict[str, Any]:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
 
     await Category.prisma().delete(where=where)
+    catalog_cache.invalidate()
+    category_ids.invalidate()
     return {"status": status.HTTP_200_OK}
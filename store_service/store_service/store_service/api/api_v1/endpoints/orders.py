@@ -1,9 +1,11 @@
 from builtins import str
+from collections import Counter
 from typing import Optional, Any
 
-from fastapi import APIRouter, Depends
+from bson import ObjectId
+from fastapi import APIRouter, Body, Depends
 from prisma.enums import OrderStatus
-from prisma.models import Order, Product, OrderProduct
+from prisma.models import Order
 from prisma.partials import OrderWithoutRelations
 from prisma.types import OrderInclude
 from starlette import status
@@ -15,7 +17,15 @@ from store_service.api.api_v1.dependencies.auth import (
     get_current_active_user,
 )
 from store_service.api.api_v1.dependencies.params import RequestParams
+from store_service.core.config import get_app_settings
+from store_service.db.base import dbapp, from_document
+from store_service.schemas.order import (
+    OrderProductIn,
+    OrderStatusBulkResult,
+    OrderStatusBulkUpdate,
+)
 from store_service.schemas.user import User
+from store_service.services import cart, orders
 
 router = APIRouter()
 
@@ -25,19 +35,10 @@ async def get_current_user_order(
     include: Optional[OrderInclude] = None,
     order_status: OrderStatus = OrderStatus.pending,
 ) -> Order | None:
-    current_user_orders = await Order.prisma().find_many(
-        where={"user_id": {"equals": current_user.id}}
-    )
-    order = list(
-        filter(lambda x: x.status == OrderStatus.pending, current_user_orders)
+    return await Order.prisma().find_first(
+        where={"user_id": current_user.id, "status": order_status},
+        include=include,
     )
-    if not len(order) > 0:
-        return None
-    order = order[0]
-    order = await Order.prisma().find_unique(
-        where={"id": order.id}, include=include
-    )
-    return order
 
 
 @router.get(
@@ -94,6 +95,18 @@ async def create_order(
     return order
 
 
+async def add_to_cart(
+    current_user: User, quantities: dict[str, int]
+) -> Optional[Order]:
+    order = await cart.add_products(
+        dbapp,
+        current_user.id,
+        quantities,
+        ttl_sec=get_app_settings().CART_RESERVATION_TTL_SEC,
+    )
+    return from_document(Order, order)
+
+
 @router.patch(
     "/product/add",
     response_model=OrderWithoutRelations,
@@ -103,33 +116,22 @@ async def add_products_to_order(
     product_id: str,
     current_user: User = Depends(get_current_active_user),
 ) -> Optional[Order]:
-    product = await Product.prisma().find_unique(where={"id": product_id})
-    order = await get_current_user_order(current_user)
-    if not order:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
-    order = await order.prisma().update(
-        data={
-            "cost": {"increment": float(product.price)},
-            "order_products": {
-                "create": [
-                    {
-                        "product_id": product_id,
-                    }
-                ],
-            },
-        },
-        where={"id": order.id},
-        include={"order_products": True},
-    )
-    order_product = await OrderProduct.prisma().update(
-        data={"product": {"connect": {"id": product_id}}},
-        where={"id": order.id},
-    )
-    product = await product.prisma().update(
-        data={"stock": {"decrement": 1}},
-        where={"id": product.id},
-    )
-    return order
+    return await add_to_cart(current_user, {product_id: 1})
+
+
+@router.patch(
+    "/products",
+    response_model=OrderWithoutRelations,
+    dependencies=[Depends(RoleChecker(["admin", "customer"]))],
+)
+async def add_many_products_to_order(
+    products_in: list[OrderProductIn] = Body(min_items=1),
+    current_user: User = Depends(get_current_active_user),
+) -> Optional[Order]:
+    quantities = Counter()
+    for x in products_in:
+        quantities[x.product_id] += x.quantity
+    return await add_to_cart(current_user, dict(quantities))
 
 
 @router.patch(
@@ -141,50 +143,13 @@ async def delete_product_from_order(
     product_id: str,
     current_user: User = Depends(get_current_active_user),
 ) -> Optional[Order]:
-    product = await Product.prisma().find_unique(where={"id": product_id})
-    if not product:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
-    order = await get_current_user_order(
-        current_user, include={"order_products": True}
-    )
-    if not order:
+    order = await get_current_user_order(current_user)
+    if not order or not ObjectId.is_valid(product_id):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
-    order_products_where_product_id = list(
-        filter(lambda x: x.product_id == product.id, order.order_products)
-    )
-    if not order_products_where_product_id:
+    removed = await cart.remove_products(dbapp, order.id, [product_id])
+    if not removed:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
-    order_products_without_product_id = list(
-        filter(lambda x: x.product_id != product.id, order.order_products)
-    )
-    order = await order.prisma().update(
-        data={
-            "cost": {
-                "decrement": float(product.price)
-                * len(order_products_where_product_id)
-            },
-            "order_products": {
-                "delete": [
-                    {
-                        "id": x.id,
-                    }
-                    for x in order_products_where_product_id
-                ]
-            },
-        },
-        where={"id": order.id},
-        include={"order_products": True},
-    )
-    order_product = await OrderProduct.prisma().update(
-        data={"product": {"disconnect": True}}, where={"id": order.id}
-    )
-    product = await Product.prisma().update_many(
-        data={"stock": {"decrement": 1}},
-        where={
-            "id": {"in": [x.id for x in order_products_without_product_id]}
-        },
-    )
-    return order
+    return await get_current_user_order(current_user)
 
 
 @router.patch(
@@ -195,18 +160,43 @@ async def delete_product_from_order(
 async def update_order_status(
     id: str, order_status_in: OrderStatus
 ) -> Optional[Order]:
-    if order_status_in == OrderStatus.deleted:
+    order = await cart.set_status(
+        dbapp,
+        id,
+        order_status_in,
+        orders.sources(order_status_in, carts=True),
+    )
+    if not order:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    return from_document(Order, order)
+
+
+@router.patch(
+    "/status/bulk",
+    response_model=OrderStatusBulkResult,
+    dependencies=[Depends(RoleChecker(["admin"]))],
+)
+async def update_orders_status(
+    update_in: OrderStatusBulkUpdate,
+) -> OrderStatusBulkResult:
+    if update_in.ids is None and update_in.where is None:
         raise HTTPException(
-            status_code=status.HTTP_409_CONFLICT,
-            detail=f"status {OrderStatus.deleted.name} not allowed",
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="either ids or where is required",
         )
-    order = await Order.prisma().update(
-        where={
-            "id": id,
-        },
-        data={"status": order_status_in},
+    chunks = await orders.update_status(
+        dbapp,
+        update_in.status,
+        ids=update_in.ids,
+        match=params.mongo_filter(update_in.where),
+        chunk_size=get_app_settings().ORDER_STATUS_BULK_CHUNK_SIZE,
+    )
+    return OrderStatusBulkResult(
+        status=update_in.status,
+        modified=sum(x["modified"] for x in chunks),
+        skipped=sum(x["skipped"] for x in chunks),
+        chunks=chunks,
     )
-    return order
 
 
 @router.delete(
@@ -219,23 +209,5 @@ async def delete_order(
     order = await get_current_user_order(current_user)
     if not order:
         raise HTTPException(status_code=status.HTTP_200_OK)
-    data = {"status": OrderStatus.deleted}
-    order_product_ids = (
-        list(map(lambda x: x.id, order.order_products))
-        if order.order_products
-        else None
-    )
-    if order_product_ids:
-        data.update(
-            {
-                "order_products": {
-                    "disconnect": {"id": x} for x in order_product_ids
-                }
-            }
-        )
-    order = await order.prisma().update(
-        data=data,
-        where={"id": order.id},
-        include={"order_products": True},
-    )
+    await cart.release_order(dbapp, current_user.id, order.id)
     return {"status": status.HTTP_200_OK}
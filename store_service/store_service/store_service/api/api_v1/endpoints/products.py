@@ -1,6 +1,7 @@
 from builtins import str
 from typing import Optional, Any
 
+from bson import ObjectId
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.params import Param
 from prisma.models import Product, Category
@@ -10,10 +11,32 @@ from prisma.partials import (
     ProductUpdate,
 )
 from starlette import status
+from starlette.requests import Request
 
 from store_service.api.api_v1.dependencies import params
 from store_service.api.api_v1.dependencies.auth import RoleChecker
 from store_service.api.api_v1.dependencies.params import RequestParams
+from store_service.core.config import get_app_settings
+from store_service.db.base import dbapp, from_document
+from store_service.services.catalog import (
+    cached,
+    catalog_cache,
+    catalog_key,
+    category_ids,
+    search_products,
+)
+from store_service.schemas.product import (
+    ImportFormat,
+    ProductBulkResult,
+    ProductBulkUpdate,
+    ProductImportResult,
+)
+from store_service.services.analytics.tracking import track_prices
+from store_service.services.products import (
+    import_products,
+    product_prices,
+    update_products,
+)
 
 router = APIRouter()
 
@@ -28,8 +51,11 @@ router = APIRouter()
 async def read_products(
     request_params: RequestParams = Depends(params.parse_query_params()),
 ) -> list[Product]:
-    product = await Product.prisma().find_many(
-        **request_params.dict(exclude_none=True)
+    product = await cached(
+        catalog_key("products", request_params),
+        lambda: Product.prisma().find_many(
+            **request_params.dict(exclude_none=True)
+        ),
     )
     return product
 
@@ -47,16 +73,64 @@ async def read_products_by_category(
         params.parse_query_params(use_order=True)
     ),
 ) -> list[Product]:
-    category = await Category.prisma().find_unique(where={"name": name})
-    if not category:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
-    where = {"category_id": category.id}
+    return await cached(
+        catalog_key("products/category", request_params, name=name),
+        lambda: find_products_by_category(name, request_params),
+    )
+
+
+async def find_products_by_category(
+    name: str, request_params: RequestParams
+) -> list[Product]:
+    """One product query: by `category_id` when the name is known, by the
+    relation otherwise."""
+    known = category_ids.get(name)
+    where = (
+        {"category_id": known[0]}
+        if known
+        else {"category": {"is": {"name": name}}}
+    )
     rp = request_params.dict(exclude_none=True)
     where.update(rp.pop("where")) if rp.get("where") else None
     products = await Product.prisma().find_many(where=where, **rp)
+    if products:
+        category_ids.set(name, products[0].category_id)
+    elif not known:
+        category = await Category.prisma().find_unique(where={"name": name})
+        if not category:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+        category_ids.set(name, category.id)
     return products
 
 
+@router.get(
+    "/search",
+    response_model=list[ProductWithoutRelations],
+    dependencies=[
+        Depends(RoleChecker(["admin", "manager", "customer", "guest"]))
+    ],
+)
+async def search_products_by_text(
+    q: str = Param(
+        min_length=1, description="words of the title or description"
+    ),
+    prefix: bool = Param(
+        False, description="titles starting with `q`, for autocomplete"
+    ),
+    request_params: RequestParams = Depends(
+        params.parse_query_params(use_order=False)
+    ),
+) -> list[Product]:
+    documents = await cached(
+        catalog_key("products/search", request_params, q=q, prefix=prefix),
+        lambda: search_products(dbapp, q, request_params, prefix=prefix),
+    )
+    return [
+        from_document(Product, {k: v for k, v in x.items() if k != "score"})
+        for x in documents
+    ]
+
+
 @router.post(
     "/",
     response_model=ProductWithoutRelations,
@@ -64,9 +138,61 @@ async def read_products_by_category(
 )
 async def create_product(product_in: ProductCreate) -> Optional[Product]:
     product = await Product.prisma().create(data=product_in.dict())
+    catalog_cache.invalidate()
     return product
 
 
+@router.post(
+    "/import",
+    response_model=ProductImportResult,
+    dependencies=[Depends(RoleChecker(["admin", "manager"]))],
+)
+async def import_products_stream(
+    request: Request,
+    format_: ImportFormat = Param(
+        ImportFormat.csv,
+        alias="format",
+        description="`csv` with a header line of `ProductCreate` fields or `ndjson` with one object per line",
+    ),
+) -> ProductImportResult:
+    result = await import_products(
+        dbapp,
+        request.stream(),
+        format_,
+        get_app_settings().PRODUCT_IMPORT_BATCH_SIZE,
+    )
+    if result["inserted"]:
+        catalog_cache.invalidate()
+    return ProductImportResult(**result)
+
+
+@router.patch(
+    "/bulk",
+    response_model=ProductBulkResult,
+    dependencies=[Depends(RoleChecker(["admin", "manager"]))],
+)
+async def update_products_bulk(
+    updates_in: list[ProductBulkUpdate],
+) -> ProductBulkResult:
+    chunks = await update_products(
+        dbapp, updates_in, get_app_settings().PRODUCT_BULK_CHUNK_SIZE
+    )
+    return ProductBulkResult(
+        matched=sum(x["matched"] for x in chunks),
+        modified=sum(x["modified"] for x in chunks),
+        chunks=chunks,
+    )
+
+
+@router.get(
+    "/cache/stats",
+    response_model=dict[str, Any],
+    dependencies=[Depends(RoleChecker(["admin"]))],
+)
+async def read_catalog_cache_stats() -> dict[str, Any]:
+    return catalog_cache.stats()
+
+
 @router.get(
     "/{id}",
     response_model=ProductWithoutRelations,
@@ -75,7 +201,10 @@ async def create_product(product_in: ProductCreate) -> Optional[Product]:
 async def read_product_by_id(
     id: str,
 ) -> Product | None:
-    product = await Product.prisma().find_unique(where={"id": id})
+    product = await cached(
+        catalog_key("products/id", id=id),
+        lambda: Product.prisma().find_unique(where={"id": id}),
+    )
     return product
 
 
@@ -87,9 +216,17 @@ async def read_product_by_id(
 async def update_product(
     id: str, product_in: ProductUpdate
 ) -> Optional[Product]:
-    return await Product.prisma().update(
-        data=product_in.dict(exclude_unset=True), where={"id": id}
-    )
+    data = product_in.dict(exclude_unset=True)
+    old_prices = {}
+    if data.get("price") is not None:
+        old_prices = await product_prices(dbapp, [id])
+    product = await Product.prisma().update(data=data, where={"id": id})
+    catalog_cache.invalidate()
+    if product and id in old_prices and old_prices[id] != product.price:
+        await track_prices(
+            dbapp, {ObjectId(id): (old_prices[id], product.price)}
+        )
+    return product
 
 
 @router.patch(
@@ -100,9 +237,11 @@ async def update_product(
 async def update_product_category(
     id: str, category_id: str
 ) -> Optional[Product]:
-    return await Product.prisma().update(
+    product = await Product.prisma().update(
         data={"category": {"connect": {"id": category_id}}}, where={"id": id}
     )
+    catalog_cache.invalidate()
+    return product
 
 
 @router.delete(
@@ -119,4 +258,5 @@ async def delete_product(id: str) -> dict[str, Any]:
         },
         include={"category": True, "orders": True},
     )
+    catalog_cache.invalidate()
     return {"status": status.HTTP_200_OK}
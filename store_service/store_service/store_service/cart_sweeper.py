@@ -0,0 +1,24 @@
+import asyncio
+
+from loguru import logger
+
+
+async def work() -> None:
+    from store_service.core.config import get_app_settings
+    from store_service.db.base import dbapp
+    from store_service.services import cart
+
+    await cart.sweep(
+        dbapp,
+        interval_sec=get_app_settings().CART_SWEEP_INTERVAL_SEC,
+        batch_size=get_app_settings().CART_SWEEP_BATCH_SIZE,
+    )
+
+
+def main() -> None:
+    logger.warning("Starting cart reservation sweeper")
+    asyncio.run(work())
+
+
+if __name__ == "__main__":
+    main()
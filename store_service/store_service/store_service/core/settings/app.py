@@ -39,6 +39,31 @@ class AppSettings(BaseAppSettings):
     AUTH_SERVICE_URL: str
     PRISMA_STUDIO_PORT: int = 5555
 
+    CATALOG_CACHE_MAXSIZE: int = 1024
+    CATALOG_CACHE_TTL_SEC: int = 30
+    CATALOG_CATEGORY_IDS_TTL_SEC: int = 600
+
+    CART_RESERVATION_TTL_SEC: int = 900
+    CART_SWEEP_INTERVAL_SEC: float = 30.0
+    CART_SWEEP_BATCH_SIZE: int = 500
+    ORDER_STATUS_BULK_CHUNK_SIZE: int = 1000
+    PRODUCT_IMPORT_BATCH_SIZE: int = 1000
+    PRODUCT_BULK_CHUNK_SIZE: int = 1000
+
+    ANALYTIC_CACHE_MAXSIZE: int = 256
+    ANALYTIC_CACHE_TTL_SEC: int = 30
+    ANALYTIC_CACHE_BUCKET_SEC: int = 60
+    ANALYTIC_STREAM_BATCH_SIZE: int = 1000
+    ANALYTIC_FETCH_CHUNK_SIZE: int = 5000
+    ANALYTIC_FETCH_CONCURRENCY: int = 4
+    ANALYTIC_WORKER_CONCURRENCY: int = 2
+    ANALYTIC_WORKER_POLL_INTERVAL_SEC: float = 1.0
+    ANALYTIC_JOB_TIMEOUT_SEC: int = 3600
+    ANALYTIC_JOB_MAX_ATTEMPTS: int = 3
+    ANALYTIC_READ_PREFERENCE: str = "secondaryPreferred"
+    ANALYTIC_MAX_STALENESS_SEC: int = 90
+    ANALYTIC_MAX_POOL_SIZE: int = 10
+
     LOGGING_LEVEL: int = logging.ERROR
     LOGGERS: tuple[str, str] = ("uvicorn.asgi", "uvicorn.access")
     LOG_FILE_MAX_BYTES = 314572800
@@ -0,0 +1,20 @@
+import asyncio
+
+from loguru import logger
+
+
+async def create_indexes() -> list[str]:
+    from store_service.db.base import dbapp
+    from store_service.db.indexes import ensure_indexes
+
+    return await ensure_indexes(dbapp)
+
+
+def main() -> None:
+    logger.warning("Ensuring indexes")
+    names = asyncio.run(create_indexes())
+    logger.warning(f"Indexes ensured: {names}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,8 @@
+from typing import Any, TypeVar
+
 import motor.motor_asyncio
+from bson import ObjectId
+from pydantic import BaseModel
 from pymongo.database import Database
 
 from store_service.core.config import get_app_settings
@@ -6,3 +10,26 @@ from store_service.core.config import get_app_settings
 client = motor.motor_asyncio.AsyncIOMotorClient(get_app_settings().MONGODB_URL)
 
 dbapp: Database = client.app
+
+analytic_client = motor.motor_asyncio.AsyncIOMotorClient(
+    get_app_settings().MONGODB_URL,
+    readPreference=get_app_settings().ANALYTIC_READ_PREFERENCE,
+    maxStalenessSeconds=get_app_settings().ANALYTIC_MAX_STALENESS_SEC,
+    maxPoolSize=get_app_settings().ANALYTIC_MAX_POOL_SIZE,
+)
+
+dbanalytic: Database = analytic_client.app
+
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+
+def from_document(model: type[ModelT], document: dict[str, Any]) -> ModelT:
+    """Prisma model of a raw MongoDB document: `_id` becomes `id` and
+    ObjectIds become strings, as Prisma returns them."""
+    return model.parse_obj(
+        {
+            "id" if k == "_id" else k: str(v) if isinstance(v, ObjectId) else v
+            for k, v in document.items()
+        }
+    )
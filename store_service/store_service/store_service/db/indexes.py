@@ -0,0 +1,89 @@
+from typing import Any
+
+from pymongo import ASCENDING, TEXT, IndexModel
+from pymongo.database import Database
+
+# Names and keys match the `map:` of the `@@index` and `@@fulltext`
+# declarations in `schema.prisma`, so `prisma db push` and `ensure_indexes`
+# agree on the same indexes. `prestart.sh` runs `ensure_indexes` after
+# `prisma db push`, which recreates any index the push dropped.
+indexes: dict[str, list[IndexModel]] = {
+    "Order": [
+        IndexModel(
+            [("user_id", ASCENDING), ("status", ASCENDING)],
+            name="Order_user_id_status_idx",
+        ),
+        IndexModel([("updated_at", ASCENDING)], name="Order_updated_at_idx"),
+    ],
+    "OrderProduct": [
+        IndexModel(
+            [("order_id", ASCENDING)], name="OrderProduct_order_id_idx"
+        ),
+        IndexModel(
+            [("product_id", ASCENDING)], name="OrderProduct_product_id_idx"
+        ),
+    ],
+    "Product": [
+        IndexModel(
+            [("title", TEXT), ("description", TEXT)],
+            name="Product_title_description_text",
+        ),
+        IndexModel(
+            [("category_id", ASCENDING)], name="Product_category_id_idx"
+        ),
+        # Prisma cannot declare a collation: kept by `ensure_indexes` alone.
+        IndexModel(
+            [("title", ASCENDING)],
+            name="Product_title_ci_idx",
+            collation={"locale": "en", "strength": 2},
+        ),
+    ],
+    "StockReservation": [
+        IndexModel(
+            [("expires_at", ASCENDING)], name="StockReservation_expires_at_idx"
+        ),
+        IndexModel(
+            [("order_id", ASCENDING)], name="StockReservation_order_id_idx"
+        ),
+    ],
+    "AnalyticJob": [
+        IndexModel(
+            [("status", ASCENDING), ("created_at", ASCENDING)],
+            name="AnalyticJob_status_created_at_idx",
+        ),
+    ],
+}
+
+
+async def ensure_indexes(db: Database) -> list[str]:
+    """Create the missing indexes; existing ones are left untouched."""
+    names = []
+    for collection, models in indexes.items():
+        names.extend(await db[collection].create_indexes(models))
+    return names
+
+
+async def index_stats(db: Database) -> list[dict[str, Any]]:
+    """`$indexStats` of every collection with declared indexes: how many
+    operations used each index since `since`, per shard."""
+    return [
+        {"collection": collection, **x}
+        for collection in indexes
+        async for x in db[collection].aggregate(
+            [
+                {"$indexStats": {}},
+                {
+                    "$project": {
+                        "_id": 0,
+                        "name": 1,
+                        "key": 1,
+                        "shard": 1,
+                        "host": 1,
+                        "ops": "$accesses.ops",
+                        "since": "$accesses.since",
+                    }
+                },
+                {"$sort": {"ops": -1}},
+            ]
+        )
+    ]
@@ -0,0 +1,20 @@
+import asyncio
+
+from loguru import logger
+
+
+async def rebuild() -> int:
+    from store_service.db.base import dbapp
+    from store_service.services.analytics import rollup
+
+    return await rollup.rebuild(dbapp)
+
+
+def main() -> None:
+    logger.warning("Rebuilding SalesRollup")
+    count = asyncio.run(rebuild())
+    logger.warning(f"SalesRollup rebuilt, {count} documents")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+from datetime import datetime
+from enum import Enum
+
+from pydantic import BaseModel, Field
+
+from store_service.api.api_v1.dependencies.params import RequestParams
+
+
+class AnalyticEngine(str, Enum):
+    prisma: str = "prisma"
+    aggregation: str = "aggregation"
+    rollup: str = "rollup"
+
+
+class ReportFormat(str, Enum):
+    json: str = "json"
+    ndjson: str = "ndjson"
+
+
+class ExportFormat(str, Enum):
+    parquet: str = "parquet"
+    arrow: str = "arrow"
+    csv: str = "csv"
+
+
+class Granularity(str, Enum):
+    day: str = "day"
+    week: str = "week"
+    month: str = "month"
+
+
+class TopBy(str, Enum):
+    revenue: str = "revenue"
+    units: str = "units"
+    buyers: str = "buyers"
+
+
+class TopEntity(str, Enum):
+    product: str = "product"
+    category: str = "category"
+
+
+class AnalyticResponse(BaseModel):
+    request_params: RequestParams
+    report: dict | None
+    elapsed_time_sec: float | int | None
+    details: dict | None
+    cache_hit: bool | None
+    data_age_sec: float | None
+    read_preference: str | None
+    max_staleness_sec: int | None = Field(
+        None,
+        description="configured bound on how far the secondary read may lag "
+        "the primary, not a measured lag: the data may be up to "
+        "`data_age_sec` + `max_staleness_sec` old",
+    )
+
+
+class SalesRevenue(BaseModel):
+    analytic_response: dict | AnalyticResponse
+    order_count: int | None
+    revenue: float | None
+    products: list[dict] | None
+
+
+class SalesTimeseries(BaseModel):
+    analytic_response: dict | AnalyticResponse
+    granularity: Granularity
+    columns: list[str] = ["bucket", "revenue", "orders", "units"]
+    data: list[list]
+
+
+class TopRanking(BaseModel):
+    analytic_response: dict | AnalyticResponse
+    by: TopBy
+    entity: TopEntity
+    items: list[dict]
+
+
+class QuantitySoldCategory(BaseModel):
+    category_id: str | None
+    category: dict | None
+    quantity_sold_products_by_status: int | None
+    buyers: dict | None
+
+
+class AnalyticReport(str, Enum):
+    sales: str = "sales"
+    sales_category: str = "sales_category"
+
+
+class AnalyticJobStatus(str, Enum):
+    queued: str = "queued"
+    running: str = "running"
+    completed: str = "completed"
+    failed: str = "failed"
+
+
+class AnalyticJobCreate(BaseModel):
+    report: AnalyticReport
+    start_datetime: datetime
+    end_datetime: datetime
+    engine: AnalyticEngine = AnalyticEngine.aggregation
+    request_params: RequestParams = RequestParams()
+    show_products: bool = True
+    show_product_orders: bool = False
+    show_product_buyers: bool = False
+    approx: bool = False
+    verbose: bool = False
+
+
+class AnalyticJob(BaseModel):
+    id: str
+    status: AnalyticJobStatus
+    params: AnalyticJobCreate
+    attempts: int = 0
+    result: dict | None
+    error: str | None
+    created_at: datetime | None
+    started_at: datetime | None
+    finished_at: datetime | None
@@ -0,0 +1,23 @@
+from prisma.enums import OrderStatus
+from pydantic import BaseModel, Field
+
+
+class OrderProductIn(BaseModel):
+    product_id: str
+    quantity: int = Field(1, ge=1)
+
+
+class OrderStatusBulkUpdate(BaseModel):
+    status: OrderStatus
+    ids: list[str] | None = Field(None, description="orders to move")
+    where: dict | None = Field(
+        None,
+        description='orders to move if `ids` is not set: `{"user_id": "..."}`',
+    )
+
+
+class OrderStatusBulkResult(BaseModel):
+    status: OrderStatus
+    modified: int
+    skipped: int
+    chunks: list[dict[str, int]]
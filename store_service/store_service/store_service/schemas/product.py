@@ -0,0 +1,35 @@
+from enum import Enum
+
+from pydantic import BaseModel, Field
+
+
+class ImportFormat(str, Enum):
+    csv: str = "csv"
+    ndjson: str = "ndjson"
+
+
+class ProductImportError(BaseModel):
+    row: int
+    title: str | None = None
+    detail: str
+
+
+class ProductImportResult(BaseModel):
+    inserted: int
+    failed: int
+    errors: list[ProductImportError]
+
+
+class ProductBulkUpdate(BaseModel):
+    id: str
+    price: float | None = Field(None, ge=0)
+    stock: int | None = Field(None, ge=0, description="new stock")
+    stock_delta: int | None = Field(
+        None, description="added to the stock unless it would go below 0"
+    )
+
+
+class ProductBulkResult(BaseModel):
+    matched: int
+    modified: int
+    chunks: list[dict[str, int]]
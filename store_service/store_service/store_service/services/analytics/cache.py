@@ -0,0 +1,71 @@
+import json
+from datetime import datetime, timezone
+from typing import Any
+
+from store_service.api.api_v1.dependencies.params import (
+    RequestParams,
+    mongo_filter,
+)
+from store_service.core.config import get_app_settings
+from store_service.services.cache import TTLCache
+
+reports_cache = TTLCache(
+    maxsize=get_app_settings().ANALYTIC_CACHE_MAXSIZE,
+    ttl=get_app_settings().ANALYTIC_CACHE_TTL_SEC,
+)
+
+
+def round_datetime(dt: datetime) -> datetime:
+    """Round down to `ANALYTIC_CACHE_BUCKET_SEC`, so that requests made a
+    few seconds apart share one cache entry."""
+    bucket = get_app_settings().ANALYTIC_CACHE_BUCKET_SEC
+    return datetime.fromtimestamp(
+        dt.timestamp() // bucket * bucket, tz=dt.tzinfo
+    )
+
+
+def report_key(
+    report: str, request_params: RequestParams, **kwargs: Any
+) -> tuple:
+    return report, request_params.json(sort_keys=True), *sorted(kwargs.items())
+
+
+def naive_utc(dt: datetime) -> datetime:
+    """Orders store naive UTC datetimes."""
+    if dt.tzinfo is None:
+        return dt
+    return dt.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def status_matches(condition: Any, status: str) -> bool:
+    """Whether `status` passes a `mongo_filter` condition on `status`.
+    Operators other than equality and membership are assumed to pass."""
+    if not isinstance(condition, dict):
+        return condition is None or condition == status
+    checks = {
+        "$eq": lambda v: status == v,
+        "$ne": lambda v: status != v,
+        "$in": lambda v: status in v,
+        "$nin": lambda v: status not in v,
+    }
+    return all(checks[k](v) for k, v in condition.items() if k in checks)
+
+
+def report_touched(key: tuple, changes: set[tuple[str, datetime]]) -> bool:
+    """Whether order lines changed at `(status, updated_at)` may alter the
+    report cached under `key`: one of them falls in its period, widened to
+    whole days as the `rollup` engine reads it, and passes its status
+    filter."""
+    kwargs = dict(key[2:])
+    where = json.loads(key[1]).get("where")
+    condition = mongo_filter(where).get("status")
+    start = naive_utc(kwargs["start_datetime"]).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    )
+    end = naive_utc(kwargs["end_datetime"])
+    return any(
+        updated_at is not None
+        and start <= updated_at <= end
+        and status_matches(condition, status)
+        for status, updated_at in changes
+    )
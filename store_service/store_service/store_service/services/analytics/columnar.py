@@ -0,0 +1,149 @@
+from collections.abc import AsyncIterable, Iterable
+from typing import Any
+
+import numpy as np
+from prisma.models import OrderProduct
+
+
+def factorize(values: list[Any]) -> tuple[np.ndarray, np.ndarray]:
+    """Return `(uniques, codes)` so that `uniques[codes] == values`."""
+    if not values:
+        return np.array([], dtype=object), np.array([], dtype=np.int64)
+    uniques, codes = np.unique(
+        np.asarray(values, dtype=object), return_inverse=True
+    )
+    return uniques, codes.astype(np.int64)
+
+
+class OrderLines:
+    """Order lines loaded once into factorized NumPy columns.
+
+    Every id column is stored as integer codes into its `*_ids` array, so
+    per-product and per-category aggregates are computed with `bincount`
+    and `unique` instead of rescanning the lines for every group."""
+
+    def __init__(
+        self,
+        product_ids: list[str],
+        category_ids: list[str],
+        order_ids: list[str],
+        user_ids: list[str],
+        prices: list[float],
+        quantities: list[int] | None = None,
+    ):
+        self.product_ids, self.product_codes = factorize(product_ids)
+        self.category_ids, self.category_codes = factorize(category_ids)
+        self.order_ids, self.order_codes = factorize(order_ids)
+        self.user_ids, self.user_codes = factorize(user_ids)
+        self.prices = np.asarray(prices, dtype=np.float64)
+        self.quantities = (
+            np.ones(len(self.prices), dtype=np.int64)
+            if quantities is None
+            else np.asarray(quantities, dtype=np.int64)
+        )
+        self.amounts = self.prices * self.quantities
+
+    @staticmethod
+    def _append(
+        columns: tuple[list, ...], orders_products: Iterable[OrderProduct]
+    ) -> None:
+        for x in orders_products:
+            if not x.product:
+                continue
+            for column, value in zip(
+                columns,
+                (
+                    x.product.id,
+                    x.product.category_id,
+                    x.order_id,
+                    x.order.user_id,
+                    x.product.price,
+                    x.quantity or 1,
+                ),
+            ):
+                column.append(value)
+
+    @classmethod
+    def from_order_products(
+        cls, orders_products: Iterable[OrderProduct]
+    ) -> "OrderLines":
+        columns = [], [], [], [], [], []
+        cls._append(columns, orders_products)
+        return cls(*columns)
+
+    @classmethod
+    async def from_chunks(
+        cls, chunks: AsyncIterable[Iterable[OrderProduct]]
+    ) -> "OrderLines":
+        """Build the columns chunk by chunk as the chunks arrive, so only
+        one chunk of Prisma models is alive at a time."""
+        columns = [], [], [], [], [], []
+        async for orders_products in chunks:
+            cls._append(columns, orders_products)
+        return cls(*columns)
+
+    def __len__(self) -> int:
+        return len(self.prices)
+
+    @property
+    def revenue(self) -> float:
+        return float(self.amounts.sum())
+
+    @property
+    def order_count(self) -> int:
+        return len(self.order_ids)
+
+    def _keys(self, by: str) -> tuple[np.ndarray, np.ndarray]:
+        if by == "product":
+            return self.product_ids, self.product_codes
+        if by == "category":
+            return self.category_ids, self.category_codes
+        raise ValueError(f"unknown group key '{by}'")
+
+    @staticmethod
+    def _distinct(
+        keys: np.ndarray, n_keys: int, values: np.ndarray, n_values: int
+    ) -> tuple[np.ndarray, list[np.ndarray]]:
+        """Distinct `values` per key: counts and the value codes."""
+        pairs = np.unique(keys * max(n_values, 1) + values)
+        pair_keys, pair_values = np.divmod(pairs, max(n_values, 1))
+        counts = np.bincount(pair_keys, minlength=n_keys)
+        return counts, np.split(pair_values, np.cumsum(counts)[:-1])
+
+    def group(
+        self,
+        by: str = "product",
+        *,
+        with_orders: bool = False,
+        with_buyers: bool = False,
+    ) -> list[dict[str, Any]]:
+        """Revenue, units, distinct orders and distinct buyers per `by`
+        (`product` or `category`), one entry per group."""
+        ids, keys = self._keys(by)
+        n_keys = len(ids)
+        if not n_keys:
+            return []
+        revenue = np.bincount(keys, weights=self.amounts, minlength=n_keys)
+        units = np.bincount(keys, weights=self.quantities, minlength=n_keys)
+        order_counts, orders = self._distinct(
+            keys, n_keys, self.order_codes, len(self.order_ids)
+        )
+        buyer_counts, buyers = self._distinct(
+            keys, n_keys, self.user_codes, len(self.user_ids)
+        )
+        return [
+            {
+                "id": ids[i],
+                "revenue": float(revenue[i]),
+                "units": int(units[i]),
+                "order_count": int(order_counts[i]),
+                "buyer_count": int(buyer_counts[i]),
+                "orders": self.order_ids[orders[i]].tolist()
+                if with_orders
+                else None,
+                "buyers": self.user_ids[buyers[i]].tolist()
+                if with_buyers
+                else None,
+            }
+            for i in range(n_keys)
+        ]
@@ -0,0 +1,129 @@
+from collections.abc import AsyncIterable, AsyncIterator
+from datetime import datetime
+from typing import Any
+
+import pyarrow as pa
+import pyarrow.csv
+import pyarrow.ipc
+import pyarrow.parquet
+from pymongo.database import Database
+
+from store_service.api.api_v1.dependencies.params import RequestParams
+from store_service.schemas.analytic import ExportFormat
+from store_service.services.analytics.pipeline import (
+    order_lines_stages,
+    orders_for_period_stages,
+)
+
+schema = pa.schema(
+    [
+        ("order_id", pa.string()),
+        ("user_id", pa.string()),
+        ("status", pa.string()),
+        ("updated_at", pa.timestamp("ms")),
+        ("product_id", pa.string()),
+        ("category_id", pa.string()),
+        ("price", pa.float64()),
+        ("quantity", pa.int64()),
+    ]
+)
+
+media_types = {
+    ExportFormat.parquet: "application/vnd.apache.parquet",
+    ExportFormat.arrow: "application/vnd.apache.arrow.stream",
+    ExportFormat.csv: "text/csv",
+}
+
+
+class ChunkSink:
+    """Write-only file that hands out what was written since the last
+    `drain`, while `tell` keeps counting from the start for the writers
+    that record offsets, like the Parquet footer."""
+
+    closed = False
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+        self._position = 0
+
+    def write(self, data: bytes) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def record_batch(lines: list[dict[str, Any]]) -> pa.RecordBatch:
+    columns = {name: [x.get(name) for x in lines] for name in schema.names}
+    for name in ("order_id", "product_id", "category_id"):
+        columns[name] = [x if x is None else str(x) for x in columns[name]]
+    return pa.RecordBatch.from_pydict(columns, schema=schema)
+
+
+async def iter_record_batches(
+    db: Database,
+    start_datetime: datetime,
+    end_datetime: datetime,
+    request_params: RequestParams,
+    batch_size: int,
+) -> AsyncIterator[pa.RecordBatch]:
+    """Order lines of the period, `batch_size` rows per record batch, as
+    they come off the aggregation cursor."""
+    lines = []
+    async for line in db.Order.aggregate(
+        [
+            *orders_for_period_stages(
+                start_datetime, end_datetime, request_params
+            ),
+            *order_lines_stages(),
+        ],
+        allowDiskUse=True,
+        batchSize=batch_size,
+    ):
+        lines.append(line)
+        if len(lines) >= batch_size:
+            yield record_batch(lines)
+            lines = []
+    if lines:
+        yield record_batch(lines)
+
+
+def new_writer(sink: ChunkSink, format_: ExportFormat):
+    if format_ == ExportFormat.parquet:
+        return pa.parquet.ParquetWriter(sink, schema)
+    if format_ == ExportFormat.arrow:
+        return pa.ipc.new_stream(sink, schema)
+    return pa.csv.CSVWriter(sink, schema)
+
+
+async def encode(
+    batches: AsyncIterable[pa.RecordBatch], format_: ExportFormat
+) -> AsyncIterator[bytes]:
+    """Encode the record batches one at a time, yielding the bytes of each
+    as soon as it is written. Parquet gets one row group per batch."""
+    sink = ChunkSink()
+    writer = new_writer(sink, format_)
+    async for batch in batches:
+        if format_ == ExportFormat.parquet:
+            writer.write_batch(batch, row_group_size=batch.num_rows)
+        else:
+            writer.write_batch(batch)
+        if data := sink.drain():
+            yield data
+    writer.close()
+    if data := sink.drain():
+        yield data
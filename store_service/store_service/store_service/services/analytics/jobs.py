@@ -0,0 +1,158 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import Any
+
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+from loguru import logger
+from pymongo import ReturnDocument
+from pymongo.database import Database
+
+from store_service.schemas.analytic import (
+    AnalyticJob,
+    AnalyticJobCreate,
+    AnalyticJobStatus,
+    AnalyticReport,
+)
+from store_service.services.analytics.reports import (
+    categories_sales_report,
+    sales_revenue_report,
+)
+
+collection = "AnalyticJob"
+
+
+def job_from_document(document: dict[str, Any]) -> AnalyticJob:
+    return AnalyticJob(
+        id=str(document["_id"]),
+        **{k: v for k, v in document.items() if k != "_id"},
+    )
+
+
+async def enqueue(db: Database, job_in: AnalyticJobCreate) -> AnalyticJob:
+    document = {
+        "status": AnalyticJobStatus.queued.value,
+        "params": jsonable_encoder(job_in),
+        "attempts": 0,
+        "created_at": datetime.utcnow(),
+    }
+    result = await db[collection].insert_one(document)
+    return job_from_document({**document, "_id": result.inserted_id})
+
+
+async def get(db: Database, id: str) -> AnalyticJob | None:
+    if not ObjectId.is_valid(id):
+        return None
+    document = await db[collection].find_one({"_id": ObjectId(id)})
+    return job_from_document(document) if document else None
+
+
+async def claim(
+    db: Database, timeout_sec: int, max_attempts: int
+) -> dict[str, Any] | None:
+    """Atomically take the oldest queued job, or a running one whose
+    worker stopped reporting back within `timeout_sec`. Timed out jobs
+    that used up their `max_attempts` are marked `failed` first."""
+    now = datetime.utcnow()
+    timed_out = {
+        "status": AnalyticJobStatus.running.value,
+        "started_at": {"$lt": now - timedelta(seconds=timeout_sec)},
+    }
+    await db[collection].update_many(
+        {**timed_out, "attempts": {"$gte": max_attempts}},
+        {
+            "$set": {
+                "status": AnalyticJobStatus.failed.value,
+                "error": f"timed out after {max_attempts} attempts",
+                "finished_at": now,
+            }
+        },
+    )
+    return await db[collection].find_one_and_update(
+        {
+            "$or": [
+                {"status": AnalyticJobStatus.queued.value},
+                {**timed_out, "attempts": {"$lt": max_attempts}},
+            ]
+        },
+        {
+            "$set": {
+                "status": AnalyticJobStatus.running.value,
+                "started_at": now,
+            },
+            "$inc": {"attempts": 1},
+        },
+        sort=[("created_at", 1)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+async def run(db: Database, document: dict[str, Any]) -> None:
+    params = AnalyticJobCreate(**document["params"])
+    try:
+        if params.report == AnalyticReport.sales:
+            result = await sales_revenue_report(
+                params.start_datetime,
+                params.end_datetime,
+                params.request_params,
+                show_products=params.show_products,
+                show_product_orders=params.show_product_orders,
+                show_product_buyers=params.show_product_buyers,
+                approx=params.approx,
+                engine=params.engine,
+            )
+        else:
+            result = await categories_sales_report(
+                params.start_datetime,
+                params.end_datetime,
+                params.request_params,
+                verbose=params.verbose,
+                approx=params.approx,
+                engine=params.engine,
+            )
+        await db[collection].update_one(
+            {"_id": document["_id"]},
+            {
+                "$set": {
+                    "status": AnalyticJobStatus.completed.value,
+                    "result": jsonable_encoder(result),
+                    "finished_at": datetime.utcnow(),
+                }
+            },
+        )
+    except Exception as e:
+        logger.error(f"analytic job {document['_id']}: {e!r}")
+        await db[collection].update_one(
+            {"_id": document["_id"]},
+            {
+                "$set": {
+                    "status": AnalyticJobStatus.failed.value,
+                    "error": str(getattr(e, "detail", None) or repr(e)),
+                    "finished_at": datetime.utcnow(),
+                }
+            },
+        )
+
+
+async def work(
+    db: Database,
+    *,
+    concurrency: int,
+    poll_interval_sec: float,
+    timeout_sec: int,
+    max_attempts: int,
+) -> None:
+    """Run queued jobs forever, at most `concurrency` at a time."""
+    semaphore = asyncio.Semaphore(concurrency)
+    tasks: set[asyncio.Task] = set()
+    while True:
+        await semaphore.acquire()
+        document = await claim(db, timeout_sec, max_attempts)
+        if not document:
+            semaphore.release()
+            await asyncio.sleep(poll_interval_sec)
+            continue
+        task = asyncio.create_task(run(db, document))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+        task.add_done_callback(lambda _: semaphore.release())
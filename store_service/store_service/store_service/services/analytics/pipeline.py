@@ -0,0 +1,372 @@
+import asyncio
+from datetime import datetime
+from typing import Any, AsyncIterator
+
+from pymongo.database import Database
+
+from store_service.api.api_v1.dependencies.params import (
+    RequestParams,
+    mongo_filter,
+)
+
+
+def orders_for_period_stages(
+    start_datetime: datetime,
+    end_datetime: datetime,
+    request_params: RequestParams,
+) -> list[dict[str, Any]]:
+    match = {"updated_at": {"$gt": start_datetime, "$lt": end_datetime}}
+    match.update(mongo_filter(request_params.where))
+    stages = [{"$match": match}, {"$sort": {"_id": 1}}]
+    if request_params.skip:
+        stages.append({"$skip": request_params.skip})
+    if request_params.take:
+        stages.append({"$limit": request_params.take})
+    return stages
+
+
+def order_lines_stages() -> list[dict[str, Any]]:
+    """One document per order line: `order_id`, `user_id`, `status`,
+    `updated_at`, `product_id`, `category_id`, the unit `price`, the
+    `quantity` (1 for lines written before quantities) and their `amount`."""
+    return [
+        {
+            "$lookup": {
+                "from": "OrderProduct",
+                "localField": "_id",
+                "foreignField": "order_id",
+                "pipeline": [{"$project": {"product_id": 1, "quantity": 1}}],
+                "as": "order_products",
+            }
+        },
+        {"$unwind": "$order_products"},
+        {
+            "$lookup": {
+                "from": "Product",
+                "localField": "order_products.product_id",
+                "foreignField": "_id",
+                "pipeline": [{"$project": {"price": 1, "category_id": 1}}],
+                "as": "product",
+            }
+        },
+        {"$unwind": "$product"},
+        {
+            "$project": {
+                "_id": 0,
+                "order_id": "$_id",
+                "user_id": 1,
+                "status": 1,
+                "updated_at": 1,
+                "product_id": "$product._id",
+                "category_id": "$product.category_id",
+                "price": "$product.price",
+                "quantity": {"$ifNull": ["$order_products.quantity", 1]},
+            }
+        },
+        {"$set": {"amount": {"$multiply": ["$price", "$quantity"]}}},
+    ]
+
+
+def sales_summary_pipeline(
+    start_datetime: datetime,
+    end_datetime: datetime,
+    request_params: RequestParams,
+) -> list[dict[str, Any]]:
+    return [
+        *orders_for_period_stages(
+            start_datetime, end_datetime, request_params
+        ),
+        *order_lines_stages(),
+        {"$group": {"_id": "$order_id", "revenue": {"$sum": "$amount"}}},
+        {
+            "$group": {
+                "_id": None,
+                "revenue": {"$sum": "$revenue"},
+                "order_count": {"$sum": 1},
+            }
+        },
+    ]
+
+
+def sales_products_pipeline(
+    start_datetime: datetime,
+    end_datetime: datetime,
+    request_params: RequestParams,
+    *,
+    show_product_orders: bool = False,
+    show_product_buyers: bool = False,
+) -> list[dict[str, Any]]:
+    group = {
+        "_id": "$product_id",
+        "revenue": {"$sum": "$amount"},
+        "units": {"$sum": "$quantity"},
+    }
+    if show_product_orders:
+        group.update({"in_orders": {"$addToSet": "$order_id"}})
+    if show_product_buyers:
+        group.update({"buyers": {"$addToSet": "$user_id"}})
+    return [
+        *orders_for_period_stages(
+            start_datetime, end_datetime, request_params
+        ),
+        *order_lines_stages(),
+        {"$group": group},
+        {"$sort": {"_id": 1}},
+    ]
+
+
+def product_report(
+    document: dict[str, Any],
+    show_product_orders: bool = False,
+    show_product_buyers: bool = False,
+) -> dict[str, Any]:
+    return {
+        "product": str(document["_id"]),
+        "revenue": document["revenue"],
+        "units": document["units"],
+        "in_orders": [str(x) for x in document["in_orders"]]
+        if show_product_orders
+        else None,
+        "buyers": {"customers": {"ids": document["buyers"]}}
+        if show_product_buyers
+        else None,
+    }
+
+
+async def sales_summary(
+    db: Database,
+    start_datetime: datetime,
+    end_datetime: datetime,
+    request_params: RequestParams,
+) -> dict[str, Any]:
+    documents = await db.Order.aggregate(
+        sales_summary_pipeline(start_datetime, end_datetime, request_params),
+        allowDiskUse=True,
+    ).to_list(length=None)
+    summary = documents[0] if documents else {}
+    return {
+        "revenue": summary.get("revenue", 0.0),
+        "order_count": summary.get("order_count", 0),
+    }
+
+
+async def iter_sales_products(
+    db: Database,
+    start_datetime: datetime,
+    end_datetime: datetime,
+    request_params: RequestParams,
+    *,
+    show_product_orders: bool = False,
+    show_product_buyers: bool = False,
+    batch_size: int = 1000,
+) -> AsyncIterator[dict[str, Any]]:
+    """Per-product records pulled from the cursor `batch_size` at a time."""
+    cursor = db.Order.aggregate(
+        sales_products_pipeline(
+            start_datetime,
+            end_datetime,
+            request_params,
+            show_product_orders=show_product_orders,
+            show_product_buyers=show_product_buyers,
+        ),
+        allowDiskUse=True,
+        batchSize=batch_size,
+    )
+    async for document in cursor:
+        yield product_report(
+            document, show_product_orders, show_product_buyers
+        )
+
+
+async def sales_report(
+    db: Database,
+    start_datetime: datetime,
+    end_datetime: datetime,
+    request_params: RequestParams,
+    *,
+    show_products: bool = True,
+    show_product_orders: bool = False,
+    show_product_buyers: bool = False,
+) -> dict[str, Any]:
+    """Compute the `/analytics/sales` report inside MongoDB.
+
+    Only the totals and one grouped document per sold product leave the
+    database, instead of every hydrated order line."""
+
+    async def products():
+        if not show_products:
+            return []
+        return [
+            x
+            async for x in iter_sales_products(
+                db,
+                start_datetime,
+                end_datetime,
+                request_params,
+                show_product_orders=show_product_orders,
+                show_product_buyers=show_product_buyers,
+            )
+        ]
+
+    summary, _products = await asyncio.gather(
+        sales_summary(db, start_datetime, end_datetime, request_params),
+        products(),
+    )
+    return {**summary, "products": _products}
+
+
+async def categories_report(
+    db: Database,
+    start_datetime: datetime,
+    end_datetime: datetime,
+    request_params: RequestParams,
+) -> list[dict[str, Any]]:
+    """Distinct orders per category, matching `OrderLines.group`."""
+    return [
+        {
+            "id": str(x["_id"]),
+            "revenue": x["revenue"],
+            "units": x["units"],
+            "order_count": x["order_count"],
+        }
+        async for x in db.Order.aggregate(
+            [
+                *orders_for_period_stages(
+                    start_datetime, end_datetime, request_params
+                ),
+                *order_lines_stages(),
+                {
+                    "$group": {
+                        "_id": {
+                            "category_id": "$category_id",
+                            "order_id": "$order_id",
+                        },
+                        "revenue": {"$sum": "$amount"},
+                        "units": {"$sum": "$quantity"},
+                    }
+                },
+                {
+                    "$group": {
+                        "_id": "$_id.category_id",
+                        "revenue": {"$sum": "$revenue"},
+                        "units": {"$sum": "$units"},
+                        "order_count": {"$sum": 1},
+                    }
+                },
+            ],
+            allowDiskUse=True,
+        )
+    ]
+
+
+def bucket_expression(date: str, granularity: str) -> dict[str, Any]:
+    expression = {"date": date, "unit": granularity}
+    if granularity == "week":
+        expression.update({"startOfWeek": "monday"})
+    return {"$dateTrunc": expression}
+
+
+async def sales_timeseries(
+    db: Database,
+    start_datetime: datetime,
+    end_datetime: datetime,
+    request_params: RequestParams,
+    granularity: str,
+) -> list[list]:
+    """`[bucket, revenue, orders, units]` rows in bucket order."""
+    return [
+        [x["_id"], x["revenue"], x["orders"], x["units"]]
+        async for x in db.Order.aggregate(
+            [
+                *orders_for_period_stages(
+                    start_datetime, end_datetime, request_params
+                ),
+                *order_lines_stages(),
+                {
+                    "$group": {
+                        "_id": {
+                            "bucket": bucket_expression(
+                                "$updated_at", granularity
+                            ),
+                            "order_id": "$order_id",
+                        },
+                        "revenue": {"$sum": "$amount"},
+                        "units": {"$sum": "$quantity"},
+                    }
+                },
+                {
+                    "$group": {
+                        "_id": "$_id.bucket",
+                        "revenue": {"$sum": "$revenue"},
+                        "units": {"$sum": "$units"},
+                        "orders": {"$sum": 1},
+                    }
+                },
+                {"$sort": {"_id": 1}},
+            ],
+            allowDiskUse=True,
+        )
+    ]
+
+
+def top_pipeline(
+    start_datetime: datetime,
+    end_datetime: datetime,
+    request_params: RequestParams,
+    *,
+    by: str,
+    entity: str,
+    limit: int,
+) -> list[dict[str, Any]]:
+    key = f"${entity}_id"
+    if by == "buyers":
+        grouping = [
+            {"$group": {"_id": {"key": key, "user_id": "$user_id"}}},
+            {"$group": {"_id": "$_id.key", "buyers": {"$sum": 1}}},
+        ]
+    else:
+        grouping = [
+            {
+                "$group": {
+                    "_id": key,
+                    "revenue": {"$sum": "$amount"},
+                    "units": {"$sum": "$quantity"},
+                }
+            }
+        ]
+    return [
+        *orders_for_period_stages(
+            start_datetime, end_datetime, request_params
+        ),
+        *order_lines_stages(),
+        *grouping,
+        {"$sort": {by: -1, "_id": 1}},
+        {"$limit": limit},
+    ]
+
+
+async def top(
+    db: Database,
+    start_datetime: datetime,
+    end_datetime: datetime,
+    request_params: RequestParams,
+    *,
+    by: str,
+    entity: str,
+    limit: int,
+) -> list[dict[str, Any]]:
+    """Top `limit` products or categories, ranked inside MongoDB."""
+    return [
+        {"id": str(x.pop("_id")), **x}
+        async for x in db.Order.aggregate(
+            top_pipeline(
+                start_datetime,
+                end_datetime,
+                request_params,
+                by=by,
+                entity=entity,
+                limit=limit,
+            ),
+            allowDiskUse=True,
+        )
+    ]
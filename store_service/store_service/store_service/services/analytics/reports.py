@@ -0,0 +1,513 @@
+import asyncio
+import json
+import time
+from datetime import datetime
+from typing import Any, AsyncIterator
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from prisma.models import Order, OrderProduct, Category
+from starlette import status
+
+from store_service.api.api_v1.dependencies.params import RequestParams
+from store_service.core.config import get_app_settings
+from store_service.db.base import dbanalytic
+from store_service.schemas.analytic import (
+    AnalyticEngine,
+    AnalyticResponse,
+    Granularity,
+    QuantitySoldCategory,
+    ReportFormat,
+    SalesRevenue,
+    SalesTimeseries,
+    TopBy,
+    TopEntity,
+    TopRanking,
+)
+from store_service.services.analytics import pipeline, rollup
+from store_service.services.analytics.columnar import OrderLines
+from store_service.services.analytics.hll import RELATIVE_ERROR
+
+
+def cached_response(
+    analytic_response: dict | AnalyticResponse, cache_hit: bool, age: float
+) -> AnalyticResponse:
+    return AnalyticResponse(
+        **{
+            **dict(analytic_response),
+            "cache_hit": cache_hit,
+            "data_age_sec": f"{age:0.5f}",
+        }
+    )
+
+
+def read_preference(engine: AnalyticEngine) -> dict[str, Any]:
+    """Where the report was read from. Reports computed inside MongoDB read
+    through `dbanalytic`, whose `maxStalenessSeconds` is reported as
+    `max_staleness_sec`: the bound the driver enforces when picking a
+    secondary, not the lag it measured.
+
+    A report computed on a lagging secondary right after an invalidation
+    is cached as fresh, so it can miss changes for up to that bound on top
+    of the cache TTL. Use engine `prisma`, which reads the primary, when
+    that matters."""
+    if engine == AnalyticEngine.prisma:
+        return {"read_preference": "primary", "max_staleness_sec": None}
+    document = dbanalytic.read_preference.document
+    return {
+        "read_preference": document["mode"],
+        "max_staleness_sec": document.get("maxStalenessSeconds"),
+    }
+
+
+async def get_order_ids_for_period(
+    start_datetime: datetime,
+    end_datetime: datetime,
+    request_params: RequestParams,
+) -> list[str]:
+    cost = {"cost": True}
+    orders_for_period = await Order.prisma().group_by(
+        ["id"],
+        sum=cost,
+        having={
+            "updated_at": {
+                "_min": {"gt": start_datetime},
+                "_max": {"lt": end_datetime},
+            }
+        },
+        order={"id": "asc"},
+        **request_params.dict(exclude_none=True),
+    )
+    return list(map(lambda x: x.get("id"), orders_for_period))
+
+
+async def get_orders_for_period(
+    start_datetime: datetime,
+    end_datetime: datetime,
+    request_params: RequestParams,
+):
+    order_ids = await get_order_ids_for_period(
+        start_datetime, end_datetime, request_params
+    )
+    orders_products = await OrderProduct.prisma().find_many(
+        where={"order_id": {"in": order_ids}},
+        include={"order": True, "product": True},
+    )
+    return orders_products
+
+
+async def iter_orders_for_period(
+    start_datetime: datetime,
+    end_datetime: datetime,
+    request_params: RequestParams,
+    *,
+    chunk_size: int,
+    concurrency: int,
+    stats: dict[str, Any],
+) -> AsyncIterator[list[OrderProduct]]:
+    """Order lines of the period fetched `chunk_size` orders per query,
+    with at most `concurrency` queries in flight, yielded as each chunk
+    completes. The chunk count and timings are collected in `stats`."""
+    start = time.time()
+    order_ids = await get_order_ids_for_period(
+        start_datetime, end_datetime, request_params
+    )
+    chunks = [
+        order_ids[i : i + chunk_size]
+        for i in range(0, len(order_ids), chunk_size)
+    ]
+    stats.update(
+        {
+            "order_ids_sec": time.time() - start,
+            "chunk_size": chunk_size,
+            "concurrency": concurrency,
+            "chunk_count": len(chunks),
+            "chunks_sec": [],
+        }
+    )
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch(chunk: list[str]) -> tuple[list[OrderProduct], float]:
+        async with semaphore:
+            chunk_start = time.time()
+            orders_products = await OrderProduct.prisma().find_many(
+                where={"order_id": {"in": chunk}},
+                include={"order": True, "product": True},
+            )
+            return orders_products, time.time() - chunk_start
+
+    tasks = [asyncio.create_task(fetch(chunk)) for chunk in chunks]
+    try:
+        for task in asyncio.as_completed(tasks):
+            orders_products, elapsed = await task
+            stats["chunks_sec"].append(elapsed)
+            yield orders_products
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def get_order_lines(
+    start_datetime: datetime,
+    end_datetime: datetime,
+    request_params: RequestParams,
+) -> tuple[OrderLines, dict[str, Any]]:
+    """`OrderLines` of the period through Prisma, in chunks unless
+    `ANALYTIC_FETCH_CHUNK_SIZE` is 0, and the fetch details."""
+    settings = get_app_settings()
+    if not settings.ANALYTIC_FETCH_CHUNK_SIZE:
+        return (
+            OrderLines.from_order_products(
+                await get_orders_for_period(
+                    start_datetime, end_datetime, request_params
+                )
+            ),
+            {"chunk_count": 1},
+        )
+    stats = {}
+    order_lines = await OrderLines.from_chunks(
+        iter_orders_for_period(
+            start_datetime,
+            end_datetime,
+            request_params,
+            chunk_size=settings.ANALYTIC_FETCH_CHUNK_SIZE,
+            concurrency=settings.ANALYTIC_FETCH_CONCURRENCY,
+            stats=stats,
+        )
+    )
+    chunks_sec = stats.pop("chunks_sec")
+    stats.update(
+        {
+            "order_ids_sec": f"{stats['order_ids_sec']:0.5f}",
+            "chunk_max_sec": f"{max(chunks_sec, default=0):0.5f}",
+            "chunk_total_sec": f"{sum(chunks_sec):0.5f}",
+        }
+    )
+    return order_lines, stats
+
+
+async def sales_revenue_report(
+    start_datetime: datetime,
+    end_datetime: datetime,
+    request_params: RequestParams,
+    *,
+    show_products: bool = True,
+    show_product_orders: bool = False,
+    show_product_buyers: bool = False,
+    approx: bool = False,
+    engine: AnalyticEngine = AnalyticEngine.aggregation,
+) -> SalesRevenue:
+    """With `approx` the `buyers` are estimated from the HyperLogLog
+    sketches of the rollup instead of listed."""
+    check_approx(approx, engine)
+    start = time.time()
+    fetch = None
+    if engine == AnalyticEngine.aggregation:
+        report = await pipeline.sales_report(
+            dbanalytic,
+            start_datetime,
+            end_datetime,
+            request_params,
+            show_products=show_products,
+            show_product_orders=show_product_orders,
+            show_product_buyers=show_product_buyers,
+        )
+    elif engine == AnalyticEngine.rollup:
+        if show_product_orders or (show_product_buyers and not approx):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"fields `in_orders` and exact `buyers` are not available with engine {engine.name}",
+            )
+        report = await rollup.sales_report(
+            dbanalytic,
+            start_datetime,
+            end_datetime,
+            request_params,
+            show_products=show_products,
+            show_product_buyers=show_product_buyers,
+        )
+    else:
+        order_lines, fetch = await get_order_lines(
+            start_datetime, end_datetime, request_params
+        )
+        report = {
+            "revenue": order_lines.revenue,
+            "order_count": order_lines.order_count,
+            "products": [
+                {
+                    "product": x["id"],
+                    "revenue": x["revenue"],
+                    "units": x["units"],
+                    "in_orders": x["orders"],
+                    "buyers": {"customers": {"ids": x["buyers"]}}
+                    if show_product_buyers
+                    else None,
+                }
+                for x in order_lines.group(
+                    "product",
+                    with_orders=show_product_orders,
+                    with_buyers=show_product_buyers,
+                )
+            ]
+            if show_products
+            else [],
+        }
+    end = time.time()
+    analytic_response = AnalyticResponse(
+        request_params=request_params,
+        report={
+            "start_datetime": start_datetime,
+            "end_datetime": end_datetime,
+            "created_at": datetime.now(),
+        },
+        elapsed_time_sec=f"{end - start:0.5f}",
+        **read_preference(engine),
+        details={
+            "engine": engine,
+            "approx": approx,
+            "product_count": len(report["products"]),
+            "fetch": fetch,
+        },
+    )
+    return SalesRevenue(analytic_response=analytic_response, **report)
+
+
+async def sales_revenue_ndjson(
+    start_datetime: datetime,
+    end_datetime: datetime,
+    request_params: RequestParams,
+    *,
+    show_products: bool = True,
+    show_product_orders: bool = False,
+    show_product_buyers: bool = False,
+) -> AsyncIterator[str]:
+    """The summary as the first line, then one line per product as it
+    comes off the aggregation cursor."""
+    start = time.time()
+    summary = await pipeline.sales_summary(
+        dbanalytic, start_datetime, end_datetime, request_params
+    )
+    analytic_response = AnalyticResponse(
+        request_params=request_params,
+        report={
+            "start_datetime": start_datetime,
+            "end_datetime": end_datetime,
+            "created_at": datetime.now(),
+        },
+        elapsed_time_sec=f"{time.time() - start:0.5f}",
+        **read_preference(AnalyticEngine.aggregation),
+        details={
+            "engine": AnalyticEngine.aggregation,
+            "format": ReportFormat.ndjson,
+        },
+    )
+    yield json.dumps(
+        jsonable_encoder({"analytic_response": analytic_response, **summary})
+    ) + "\n"
+    if not show_products:
+        return
+    async for product in pipeline.iter_sales_products(
+        dbanalytic,
+        start_datetime,
+        end_datetime,
+        request_params,
+        show_product_orders=show_product_orders,
+        show_product_buyers=show_product_buyers,
+        batch_size=get_app_settings().ANALYTIC_STREAM_BATCH_SIZE,
+    ):
+        yield json.dumps(product) + "\n"
+
+
+async def sales_timeseries_report(
+    start_datetime: datetime,
+    end_datetime: datetime,
+    request_params: RequestParams,
+    *,
+    granularity: Granularity = Granularity.day,
+    engine: AnalyticEngine = AnalyticEngine.aggregation,
+) -> SalesTimeseries:
+    start = time.time()
+    if engine == AnalyticEngine.aggregation:
+        data = await pipeline.sales_timeseries(
+            dbanalytic,
+            start_datetime,
+            end_datetime,
+            request_params,
+            granularity,
+        )
+    elif engine == AnalyticEngine.rollup:
+        data = await rollup.sales_timeseries(
+            dbanalytic,
+            start_datetime,
+            end_datetime,
+            request_params,
+            granularity,
+        )
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"engine {engine.name} is not supported",
+        )
+    end = time.time()
+    analytic_response = AnalyticResponse(
+        request_params=request_params,
+        report={
+            "start_datetime": start_datetime,
+            "end_datetime": end_datetime,
+            "created_at": datetime.now(),
+        },
+        elapsed_time_sec=f"{end - start:0.5f}",
+        **read_preference(engine),
+        details={"engine": engine, "bucket_count": len(data)},
+    )
+    return SalesTimeseries(
+        analytic_response=analytic_response,
+        granularity=granularity,
+        data=data,
+    )
+
+
+async def top_report(
+    start_datetime: datetime,
+    end_datetime: datetime,
+    request_params: RequestParams,
+    *,
+    by: TopBy = TopBy.revenue,
+    entity: TopEntity = TopEntity.product,
+    limit: int = 10,
+    engine: AnalyticEngine = AnalyticEngine.aggregation,
+) -> TopRanking:
+    """Distinct `buyers` on engine `rollup` are HyperLogLog estimates,
+    reported as `approx` with their `relative_error` in the details."""
+    start = time.time()
+    approx = engine == AnalyticEngine.rollup and by == TopBy.buyers
+    if engine == AnalyticEngine.aggregation:
+        source = pipeline
+    elif engine == AnalyticEngine.rollup:
+        source = rollup
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"engine {engine.name} is not supported",
+        )
+    items = await source.top(
+        dbanalytic,
+        start_datetime,
+        end_datetime,
+        request_params,
+        by=by.value,
+        entity=entity.value,
+        limit=limit,
+    )
+    end = time.time()
+    analytic_response = AnalyticResponse(
+        request_params=request_params,
+        report={
+            "start_datetime": start_datetime,
+            "end_datetime": end_datetime,
+            "created_at": datetime.now(),
+        },
+        elapsed_time_sec=f"{end - start:0.5f}",
+        **read_preference(engine),
+        details={
+            "engine": engine,
+            "limit": limit,
+            "approx": approx,
+            "relative_error": RELATIVE_ERROR if approx else None,
+        },
+    )
+    return TopRanking(
+        analytic_response=analytic_response,
+        by=by,
+        entity=entity,
+        items=items,
+    )
+
+
+def check_approx(approx: bool, engine: AnalyticEngine) -> None:
+    if approx and engine != AnalyticEngine.rollup:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"approx requires engine {AnalyticEngine.rollup.name}",
+        )
+
+
+async def get_categories_by_ids(ids: list[str]) -> dict[str, Category]:
+    categories = await Category.prisma().find_many(where={"id": {"in": ids}})
+    return {x.id: x for x in categories}
+
+
+async def categories_sales_report(
+    start_datetime: datetime,
+    end_datetime: datetime,
+    request_params: RequestParams,
+    *,
+    verbose: bool = False,
+    approx: bool = False,
+    engine: AnalyticEngine = AnalyticEngine.aggregation,
+) -> dict[str, AnalyticResponse | list[QuantitySoldCategory]]:
+    check_approx(approx, engine)
+    start = time.time()
+    timings = {}
+    fetch = None
+    if engine == AnalyticEngine.aggregation:
+        sold_categories = await pipeline.categories_report(
+            dbanalytic, start_datetime, end_datetime, request_params
+        )
+    elif engine == AnalyticEngine.rollup:
+        sold_categories = await rollup.categories_report(
+            dbanalytic,
+            start_datetime,
+            end_datetime,
+            request_params,
+            show_buyers=approx,
+        )
+    else:
+        order_lines, fetch = await get_order_lines(
+            start_datetime, end_datetime, request_params
+        )
+        timings.update({"fetch_sec": time.time() - start})
+        sold_categories = order_lines.group("category")
+    timings.update(
+        {"aggregate_sec": time.time() - start - timings.get("fetch_sec", 0)}
+    )
+    categories = {}
+    if verbose:
+        hydrate_start = time.time()
+        categories = await get_categories_by_ids(
+            [x["id"] for x in sold_categories]
+        )
+        timings.update({"hydrate_sec": time.time() - hydrate_start})
+    end = time.time()
+    analytic_response = AnalyticResponse(
+        request_params=request_params,
+        report={
+            "start_datetime": start_datetime,
+            "end_datetime": end_datetime,
+            "created_at": datetime.now(),
+        },
+        elapsed_time_sec=f"{end - start:0.5f}",
+        **read_preference(engine),
+        details={
+            "engine": engine,
+            "approx": approx,
+            "category_count": len(sold_categories),
+            "fetch": fetch,
+            "timings": {k: f"{v:0.5f}" for k, v in timings.items()},
+        },
+    )
+    quantity_sold_category = {
+        "analytic_response": analytic_response,
+        "categories": [
+            QuantitySoldCategory(
+                category_id=x["id"],
+                category=categories[x["id"]].dict()
+                if x["id"] in categories
+                else None,
+                quantity_sold_products_by_status=x["order_count"],
+                buyers=x.get("buyers"),
+            )
+            for x in sold_categories
+        ],
+    }
+    return quantity_sold_category
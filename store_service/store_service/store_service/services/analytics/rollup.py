@@ -0,0 +1,621 @@
+import heapq
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, AsyncIterable, AsyncIterator, Callable
+
+from bson import ObjectId
+from fastapi import HTTPException
+from pymongo import ASCENDING, UpdateOne
+from pymongo.database import Database
+
+from store_service.api.api_v1.dependencies.params import (
+    RequestParams,
+    mongo_filter,
+)
+from store_service.services.analytics.hll import HyperLogLog, RELATIVE_ERROR
+from store_service.services.analytics.pipeline import (
+    bucket_expression,
+    order_lines_stages,
+)
+
+collection = "SalesRollup"
+
+day_stage = {
+    "$set": {"day": {"$dateTrunc": {"date": "$updated_at", "unit": "day"}}}
+}
+
+
+def rollup_keys(line: dict[str, Any]) -> list[tuple]:
+    """`(day, status, category_id, product_id)` keys an order line counts
+    towards: the product row, the category row and the day total row."""
+    day, status = line["day"], line["status"]
+    return [
+        (day, status, line["category_id"], line["product_id"]),
+        (day, status, line["category_id"], None),
+        (day, status, None, None),
+    ]
+
+
+def key_filter(key: tuple) -> dict[str, Any]:
+    return dict(zip(("day", "status", "category_id", "product_id"), key))
+
+
+def empty_counters() -> dict[str, Any]:
+    return {"revenue": 0.0, "units": 0, "orders": set(), "buyers": set()}
+
+
+def counters(lines: list[dict[str, Any]]) -> dict[tuple, dict[str, Any]]:
+    result = defaultdict(empty_counters)
+    for line in lines:
+        for key in rollup_keys(line):
+            result[key]["revenue"] += line["amount"]
+            result[key]["units"] += line["quantity"]
+            result[key]["orders"].add(line["order_id"])
+            result[key]["buyers"].add(line["user_id"])
+    return result
+
+
+def truncate_day(dt: datetime | None) -> datetime | None:
+    return (
+        dt.replace(hour=0, minute=0, second=0, microsecond=0) if dt else None
+    )
+
+
+def order_line(
+    order: dict[str, Any], product: dict[str, Any], quantity: int
+) -> dict[str, Any]:
+    """An order line in the shape of `order_lines_stages` with its rollup
+    day."""
+    return {
+        "order_id": order["_id"],
+        "user_id": order["user_id"],
+        "status": order["status"],
+        "updated_at": order.get("updated_at"),
+        "product_id": product["_id"],
+        "category_id": product["category_id"],
+        "price": product["price"],
+        "quantity": quantity,
+        "amount": product["price"] * quantity,
+        "day": truncate_day(order.get("updated_at")),
+    }
+
+
+def restamp(
+    lines: list[dict[str, Any]], status: str, updated_at: datetime
+) -> list[dict[str, Any]]:
+    """`lines` of orders moved to `status` at `updated_at`."""
+    return [
+        {
+            **x,
+            "status": status,
+            "updated_at": updated_at,
+            "day": truncate_day(updated_at),
+        }
+        for x in lines
+    ]
+
+
+async def order_lines(
+    db: Database, orders: list[dict[str, Any]], session=None
+) -> list[dict[str, Any]]:
+    """Current lines of `orders` read with two indexed finds, in the
+    transaction of the caller that is about to change them. The caller
+    derives the lines after its write from these and from the write itself,
+    so the rollup moves by exactly what the transaction did."""
+    if not orders:
+        return []
+    by_id = {x["_id"]: x for x in orders}
+    lines = await db.OrderProduct.find(
+        {"order_id": {"$in": list(by_id)}},
+        {"order_id": 1, "product_id": 1, "quantity": 1},
+        session=session,
+    ).to_list(length=None)
+    products = {
+        x["_id"]: x
+        async for x in db.Product.find(
+            {"_id": {"$in": list({x.get("product_id") for x in lines})}},
+            {"price": 1, "category_id": 1},
+            session=session,
+        )
+    }
+    return [
+        order_line(
+            by_id[x["order_id"]],
+            products[x["product_id"]],
+            x.get("quantity") or 1,
+        )
+        for x in lines
+        if x.get("product_id") in products
+    ]
+
+
+async def apply(
+    db: Database,
+    before: list[dict[str, Any]],
+    after: list[dict[str, Any]],
+) -> int:
+    """Move the rollup from the `before` to the `after` lines of the same
+    orders with `$inc` upserts, and add the buyers of `after` to the rows'
+    HyperLogLog sketches with `$max` per register. The increments commute,
+    so changes applied concurrently add up. Returns the number of touched
+    rows."""
+    old, new = counters(before), counters(after)
+    empty = empty_counters()
+    operations = []
+    for key in old.keys() | new.keys():
+        o, n = old.get(key, empty), new.get(key, empty)
+        inc = {
+            "revenue": n["revenue"] - o["revenue"],
+            "units": n["units"] - o["units"],
+            "orders": len(n["orders"]) - len(o["orders"]),
+        }
+        if not any(inc.values()):
+            continue
+        update = {"$inc": inc}
+        if n["buyers"]:
+            registers = HyperLogLog(n["buyers"]).registers.items()
+            update.update(
+                {"$max": {f"buyers_hll.{i}": rank for i, rank in registers}}
+            )
+        operations.append(UpdateOne(key_filter(key), update, upsert=True))
+    if operations:
+        await db[collection].bulk_write(operations, ordered=False)
+    return len(operations)
+
+
+def reprice_pipeline(product_id: ObjectId) -> list[dict[str, Any]]:
+    """Units of the lines of `product_id` per rollup day and status, with
+    the earliest `updated_at` of their orders."""
+    return [
+        {"$match": {"product_id": product_id}},
+        {
+            "$lookup": {
+                "from": "Order",
+                "localField": "order_id",
+                "foreignField": "_id",
+                "pipeline": [{"$project": {"status": 1, "updated_at": 1}}],
+                "as": "order",
+            }
+        },
+        {"$unwind": "$order"},
+        {
+            "$group": {
+                "_id": {
+                    "day": {
+                        "$dateTrunc": {
+                            "date": "$order.updated_at",
+                            "unit": "day",
+                        }
+                    },
+                    "status": "$order.status",
+                },
+                "units": {"$sum": {"$ifNull": ["$quantity", 1]}},
+                "updated_at": {"$min": "$order.updated_at"},
+            }
+        },
+    ]
+
+
+def reprice_operations(
+    product: dict[str, Any], delta: float, group: dict[str, Any]
+) -> list[UpdateOne]:
+    """`$inc` of the revenue of the rows a `reprice_pipeline` group counts
+    towards by `delta` per unit."""
+    line = {
+        **group["_id"],
+        "category_id": product["category_id"],
+        "product_id": product["_id"],
+    }
+    return [
+        UpdateOne(
+            key_filter(key), {"$inc": {"revenue": delta * group["units"]}}
+        )
+        for key in rollup_keys(line)
+    ]
+
+
+async def reprice(
+    db: Database, product_id: ObjectId, delta: float
+) -> set[tuple[str, datetime]]:
+    """Move the revenue of every line of `product_id` by `delta` per unit
+    after a price change. Lines are priced at the current price of their
+    product, as `rebuild` prices them. Returns the `(status, updated_at)`
+    of the touched rows."""
+    product = await db.Product.find_one(
+        {"_id": product_id}, {"category_id": 1}
+    )
+    if not product or not delta:
+        return set()
+    operations = []
+    changes = set()
+    async for x in db.OrderProduct.aggregate(
+        reprice_pipeline(product_id), allowDiskUse=True
+    ):
+        operations.extend(reprice_operations(product, delta, x))
+        changes.update(
+            {
+                (x["_id"]["status"], x["_id"]["day"]),
+                (x["_id"]["status"], x["updated_at"]),
+            }
+        )
+    if operations:
+        await db[collection].bulk_write(operations, ordered=False)
+    return changes
+
+
+def rebuild_pipeline() -> list[dict[str, Any]]:
+    return [
+        *order_lines_stages(),
+        day_stage,
+        {
+            "$set": {
+                "keys": [
+                    {"c": "$category_id", "p": "$product_id"},
+                    {"c": "$category_id", "p": None},
+                    {"c": None, "p": None},
+                ]
+            }
+        },
+        {"$unwind": "$keys"},
+        {
+            "$group": {
+                "_id": {
+                    "day": "$day",
+                    "status": "$status",
+                    "category_id": "$keys.c",
+                    "product_id": "$keys.p",
+                    "order_id": "$order_id",
+                },
+                "user_id": {"$first": "$user_id"},
+                "revenue": {"$sum": "$amount"},
+                "units": {"$sum": "$quantity"},
+            }
+        },
+        {
+            "$group": {
+                "_id": {
+                    "day": "$_id.day",
+                    "status": "$_id.status",
+                    "category_id": "$_id.category_id",
+                    "product_id": "$_id.product_id",
+                },
+                "revenue": {"$sum": "$revenue"},
+                "units": {"$sum": "$units"},
+                "orders": {"$sum": 1},
+                "buyers": {"$addToSet": "$user_id"},
+            }
+        },
+        {
+            "$project": {
+                "_id": 0,
+                "day": "$_id.day",
+                "status": "$_id.status",
+                "category_id": "$_id.category_id",
+                "product_id": "$_id.product_id",
+                "revenue": 1,
+                "units": 1,
+                "orders": 1,
+                "buyers": 1,
+            }
+        },
+    ]
+
+
+async def rebuild(db: Database, batch_size: int = 1000) -> int:
+    """Recompute the whole rollup from the order history into a temporary
+    collection that then replaces `SalesRollup` in a single rename, so
+    readers never see it empty or partially built.
+
+    Changes tracked while the aggregation runs go to the replaced
+    collection, so run it while order writes are quiet."""
+    building = db[f"{collection}_rebuild"]
+    await building.drop()
+    await building.create_index(
+        [
+            ("day", ASCENDING),
+            ("status", ASCENDING),
+            ("category_id", ASCENDING),
+            ("product_id", ASCENDING),
+        ],
+        unique=True,
+        name=f"{collection}_day_status_category_id_product_id_key",
+    )
+    count = 0
+    batch = []
+    async for document in db.Order.aggregate(
+        rebuild_pipeline(), allowDiskUse=True, batchSize=batch_size
+    ):
+        buyers = document.pop("buyers")
+        document.update({"buyers_hll": HyperLogLog(buyers).to_document()})
+        batch.append(document)
+        if len(batch) >= batch_size:
+            await building.insert_many(batch, ordered=False)
+            count, batch = count + len(batch), []
+    if batch:
+        await building.insert_many(batch, ordered=False)
+        count += len(batch)
+    await building.rename(collection, dropTarget=True)
+    return count
+
+
+def rollup_match(
+    start_datetime: datetime,
+    end_datetime: datetime,
+    request_params: RequestParams,
+) -> dict[str, Any]:
+    """Rows are daily, so `start_datetime` is rounded down to its day and
+    the rows of the day of `end_datetime` are counted whole, including the
+    orders updated after it. Rows have no orders to page, so a range is
+    rejected."""
+    if request_params.skip or request_params.take is not None:
+        raise HTTPException(
+            400,
+            "A range is not supported on the rollup, it covers every order",
+        )
+    where = mongo_filter(request_params.where)
+    if where.keys() - {"status"}:
+        raise HTTPException(
+            400, f"Only 'status' can be filtered on the rollup, got {where}"
+        )
+    day = start_datetime.replace(hour=0, minute=0, second=0, microsecond=0)
+    match = {"day": {"$gte": day, "$lt": end_datetime}}
+    match.update(where)
+    return match
+
+
+def level_match(entity: str | None) -> dict[str, Any]:
+    """Rows of one level: `product`, `category` or the day total (`None`)."""
+    if entity == "product":
+        return {"product_id": {"$ne": None}}
+    if entity == "category":
+        return {"category_id": {"$ne": None}, "product_id": None}
+    return {"category_id": None, "product_id": None}
+
+
+async def buyer_counts(
+    db: Database, match: dict[str, Any], entity: str
+) -> dict[Any, int]:
+    """Estimated distinct buyers per `entity`. The daily sketches are merged
+    inside MongoDB by taking the maximum rank of every register."""
+    return {
+        x["_id"]: HyperLogLog.from_document(x["registers"]).count()
+        async for x in db[collection].aggregate(
+            [
+                {"$match": {**match, **level_match(entity)}},
+                {
+                    "$project": {
+                        "key": f"${entity}_id",
+                        "registers": {
+                            "$objectToArray": {"$ifNull": ["$buyers_hll", {}]}
+                        },
+                    }
+                },
+                {"$unwind": "$registers"},
+                {
+                    "$group": {
+                        "_id": {"key": "$key", "index": "$registers.k"},
+                        "rank": {"$max": "$registers.v"},
+                    }
+                },
+                {
+                    "$group": {
+                        "_id": "$_id.key",
+                        "registers": {
+                            "$push": {"k": "$_id.index", "v": "$rank"}
+                        },
+                    }
+                },
+                {"$project": {"registers": {"$arrayToObject": "$registers"}}},
+            ],
+            allowDiskUse=True,
+        )
+    }
+
+
+def approx_buyers(count: int) -> dict[str, Any]:
+    return {
+        "customers": {"approx_count": count, "relative_error": RELATIVE_ERROR}
+    }
+
+
+async def sales_report(
+    db: Database,
+    start_datetime: datetime,
+    end_datetime: datetime,
+    request_params: RequestParams,
+    *,
+    show_products: bool = True,
+    show_product_buyers: bool = False,
+) -> dict[str, Any]:
+    """`buyers` are estimated from the HyperLogLog sketches."""
+    match = rollup_match(start_datetime, end_datetime, request_params)
+    totals = (
+        await db[collection]
+        .aggregate(
+            [
+                {"$match": {**match, **level_match(None)}},
+                {
+                    "$group": {
+                        "_id": None,
+                        "revenue": {"$sum": "$revenue"},
+                        "order_count": {"$sum": "$orders"},
+                    }
+                },
+            ]
+        )
+        .to_list(length=None)
+    )
+    products = []
+    buyers = {}
+    if show_products and show_product_buyers:
+        buyers = await buyer_counts(db, match, "product")
+    if show_products:
+        products = [
+            {
+                "product": str(x["_id"]),
+                "revenue": x["revenue"],
+                "units": x["units"],
+                "in_orders": None,
+                "buyers": approx_buyers(buyers.get(x["_id"], 0))
+                if show_product_buyers
+                else None,
+            }
+            async for x in db[collection].aggregate(
+                [
+                    {"$match": {**match, **level_match("product")}},
+                    {
+                        "$group": {
+                            "_id": "$product_id",
+                            "revenue": {"$sum": "$revenue"},
+                            "units": {"$sum": "$units"},
+                        }
+                    },
+                    {"$match": {"units": {"$gt": 0}}},
+                    {"$sort": {"_id": 1}},
+                ]
+            )
+        ]
+    summary = totals[0] if totals else {}
+    return {
+        "revenue": summary.get("revenue", 0.0),
+        "order_count": summary.get("order_count", 0),
+        "products": products,
+    }
+
+
+async def categories_report(
+    db: Database,
+    start_datetime: datetime,
+    end_datetime: datetime,
+    request_params: RequestParams,
+    *,
+    show_buyers: bool = False,
+) -> list[dict[str, Any]]:
+    """Distinct orders per category, matching `OrderLines.group`, and with
+    `show_buyers` the estimated distinct buyers."""
+    match = rollup_match(start_datetime, end_datetime, request_params)
+    buyers = {}
+    if show_buyers:
+        buyers = await buyer_counts(db, match, "category")
+    return [
+        {
+            "id": str(x["_id"]),
+            "revenue": x["revenue"],
+            "units": x["units"],
+            "order_count": x["orders"],
+            "buyers": approx_buyers(buyers.get(x["_id"], 0))
+            if show_buyers
+            else None,
+        }
+        async for x in db[collection].aggregate(
+            [
+                {"$match": {**match, **level_match("category")}},
+                {
+                    "$group": {
+                        "_id": "$category_id",
+                        "revenue": {"$sum": "$revenue"},
+                        "units": {"$sum": "$units"},
+                        "orders": {"$sum": "$orders"},
+                    }
+                },
+                {"$match": {"units": {"$gt": 0}}},
+            ]
+        )
+    ]
+
+
+async def sales_timeseries(
+    db: Database,
+    start_datetime: datetime,
+    end_datetime: datetime,
+    request_params: RequestParams,
+    granularity: str,
+) -> list[list]:
+    """`[bucket, revenue, orders, units]` rows from the day total rows."""
+    match = rollup_match(start_datetime, end_datetime, request_params)
+    return [
+        [x["_id"], x["revenue"], x["orders"], x["units"]]
+        async for x in db[collection].aggregate(
+            [
+                {"$match": {**match, **level_match(None)}},
+                {
+                    "$group": {
+                        "_id": bucket_expression("$day", granularity),
+                        "revenue": {"$sum": "$revenue"},
+                        "units": {"$sum": "$units"},
+                        "orders": {"$sum": "$orders"},
+                    }
+                },
+                {"$match": {"units": {"$gt": 0}}},
+                {"$sort": {"_id": 1}},
+            ]
+        )
+    ]
+
+
+async def nlargest(
+    n: int,
+    iterable: AsyncIterable[dict[str, Any]],
+    key: Callable[[dict[str, Any]], Any],
+) -> list[dict[str, Any]]:
+    """`heapq.nlargest` over an async iterable, holding at most `n` items."""
+    heap = []
+    async for i, x in aenumerate(iterable):
+        item = (key(x), -i, x)
+        if len(heap) < n:
+            heapq.heappush(heap, item)
+        elif item > heap[0]:
+            heapq.heapreplace(heap, item)
+    return [x for *_, x in sorted(heap, reverse=True)]
+
+
+async def aenumerate(
+    iterable: AsyncIterable[Any],
+) -> AsyncIterator[tuple[int, Any]]:
+    i = 0
+    async for x in iterable:
+        yield i, x
+        i += 1
+
+
+async def top(
+    db: Database,
+    start_datetime: datetime,
+    end_datetime: datetime,
+    request_params: RequestParams,
+    *,
+    by: str,
+    entity: str,
+    limit: int,
+) -> list[dict[str, Any]]:
+    """Top `limit` products or categories, ranked with a bounded heap over
+    the per-entity sums of the rollup rows. `buyers` are estimated from the
+    HyperLogLog sketches."""
+    match = rollup_match(start_datetime, end_datetime, request_params)
+    buyers = {}
+    if by == "buyers":
+        buyers = await buyer_counts(db, match, entity)
+    cursor = db[collection].aggregate(
+        [
+            {"$match": {**match, **level_match(entity)}},
+            {
+                "$group": {
+                    "_id": f"${entity}_id",
+                    "revenue": {"$sum": "$revenue"},
+                    "units": {"$sum": "$units"},
+                }
+            },
+            {"$match": {"units": {"$gt": 0}}},
+        ]
+    )
+
+    async def rows():
+        async for x in cursor:
+            if by == "buyers":
+                x.update({"buyers": buyers.get(x["_id"], 0)})
+            yield x
+
+    return [
+        {"id": str(x.pop("_id")), **x}
+        for x in await nlargest(limit, rows(), key=lambda x: x[by])
+    ]
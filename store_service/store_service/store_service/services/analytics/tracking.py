@@ -0,0 +1,57 @@
+from typing import Any
+
+from bson import ObjectId
+from prisma.enums import OrderStatus
+from pymongo.database import Database
+
+from store_service.services.analytics import rollup
+from store_service.services.analytics.cache import (
+    report_touched,
+    reports_cache,
+)
+
+
+def invalidate_reports(
+    before: list[dict[str, Any]], after: list[dict[str, Any]]
+) -> int:
+    """Drop the cached reports whose period and status filter a change of
+    order lines touches. Changes of carts alone (`pending`) are left to the
+    cache TTL: they are the most frequent writes and would otherwise keep
+    the dashboards from ever hitting the cache. Returns the number of
+    dropped reports."""
+    changes = {(x["status"], x["updated_at"]) for x in [*before, *after]}
+    if {x for x, _ in changes} <= {OrderStatus.pending.value}:
+        return 0
+    return reports_cache.invalidate(lambda key: report_touched(key, changes))
+
+
+async def track(
+    db: Database,
+    before: list[dict[str, Any]],
+    after: list[dict[str, Any]],
+) -> None:
+    """Keep the analytic state derived from orders (`SalesRollup`, cached
+    reports) in step with a change of order lines from `before` to `after`.
+
+    Both are derived inside the transaction that made the change and are
+    applied once it commits. A process dying in between leaves the rollup
+    behind until the next `rebuild`."""
+    await rollup.apply(db, before, after)
+    invalidate_reports(before, after)
+
+
+async def track_prices(
+    db: Database, prices: dict[ObjectId, tuple[float, float]]
+) -> None:
+    """Keep the analytic state in step with `(old, new)` price changes per
+    product. Every line of a repriced product moves with it, in any status,
+    so every report covering one of them is dropped.
+
+    A cart change racing a price change of one of its products, or two
+    racing price changes of one product, leave the rollup off until the
+    next `rebuild`."""
+    changes = set()
+    for product_id, (old, new) in prices.items():
+        changes.update(await rollup.reprice(db, product_id, new - old))
+    if changes:
+        reports_cache.invalidate(lambda key: report_touched(key, changes))
@@ -0,0 +1,104 @@
+import asyncio
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable, Hashable
+from typing import Any
+
+
+class TTLCache:
+    """In-process LRU cache whose entries also expire after `ttl` seconds.
+
+    `get_or_compute` holds a lock per key, so concurrent misses on the same
+    key run `compute` once and the others wait for its result. A lock goes
+    as soon as no call holds or waits for it, whether `compute` returned,
+    raised or was invalidated, so keys that are never asked again do not
+    keep one. The cache
+    lives in a single worker process; other gunicorn workers only see
+    invalidations through the TTL."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._locks: dict[Hashable, asyncio.Lock] = {}
+        self._lock_users: dict[Hashable, int] = {}
+        self._stale: set[Hashable] = set()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable) -> tuple[Any, float] | None:
+        """`(value, age_sec)` of a fresh entry, `None` otherwise."""
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        created_at, value = entry
+        age = time.monotonic() - created_at
+        if age > self.ttl:
+            self._evict(key)
+            return None
+        self._data.move_to_end(key)
+        return value, age
+
+    def set(self, key: Hashable, value: Any) -> None:
+        self._data[key] = (time.monotonic(), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._evict(next(iter(self._data)))
+
+    def _evict(self, key: Hashable) -> None:
+        del self._data[key]
+        self.evictions += 1
+
+    def invalidate(self, predicate: Callable[[Hashable], bool] = None) -> int:
+        """Drop every entry, or the ones whose key matches `predicate`.
+        Values of those keys being computed meanwhile are not stored."""
+        keys = [k for k in self._data if predicate is None or predicate(k)]
+        for key in keys:
+            del self._data[key]
+        self._stale.update(
+            k for k in self._locks if predicate is None or predicate(k)
+        )
+        return len(keys)
+
+    async def get_or_compute(
+        self, key: Hashable, compute: Callable[[], Awaitable[Any]]
+    ) -> tuple[Any, bool, float]:
+        """`(value, cache_hit, age_sec)`"""
+        entry = self.get(key)
+        if entry is not None:
+            self.hits += 1
+            return entry[0], True, entry[1]
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        self._lock_users[key] = self._lock_users.get(key, 0) + 1
+        try:
+            async with lock:
+                entry = self.get(key)
+                if entry is not None:
+                    self.hits += 1
+                    return entry[0], True, entry[1]
+                self.misses += 1
+                self._stale.discard(key)
+                value = await compute()
+                if key not in self._stale:
+                    self.set(key, value)
+        finally:
+            self._lock_users[key] -= 1
+            if not self._lock_users[key]:
+                del self._lock_users[key]
+                del self._locks[key]
+                self._stale.discard(key)
+        return value, False, 0.0
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl_sec": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
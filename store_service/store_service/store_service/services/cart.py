@@ -0,0 +1,408 @@
+import asyncio
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from typing import Any
+
+from bson import ObjectId
+from fastapi import HTTPException
+from prisma.enums import OrderStatus
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.database import Database
+from starlette import status
+
+from store_service.services.analytics import rollup
+from store_service.services.analytics.tracking import track
+
+reservations = "StockReservation"
+
+
+def line_units(lines: list[dict[str, Any]]) -> Counter:
+    """Quantity per product of order lines, 1 for lines written before
+    quantities."""
+    units = Counter()
+    for line in lines:
+        if line.get("product_id"):
+            units[line["product_id"]] += line.get("quantity") or 1
+    return units
+
+
+async def add_products(
+    db: Database, user_id: str, quantities: dict[str, int], ttl_sec: int
+) -> dict[str, Any]:
+    """Add `quantities` of products to the pending order of `user_id` in a
+    single transaction: reserve the stock if there is enough of every
+    product, increment the order cost and the quantity of one line per
+    product. The reservations expire after `ttl_sec` unless the order
+    leaves `pending` first. Returns the updated order."""
+    if not quantities or not all(map(ObjectId.is_valid, quantities)):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    quantities = {ObjectId(k): v for k, v in quantities.items()}
+    now = datetime.utcnow()
+
+    async def transaction(session) -> tuple[dict[str, Any], list, list]:
+        result = await db.Product.bulk_write(
+            [
+                UpdateOne(
+                    {"_id": product_id, "stock": {"$gte": quantity}},
+                    {
+                        "$inc": {"stock": -quantity},
+                        "$set": {"updated_at": now},
+                    },
+                )
+                for product_id, quantity in quantities.items()
+            ],
+            ordered=False,
+            session=session,
+        )
+        if result.matched_count < len(quantities):
+            if await db.Product.count_documents(
+                {"_id": {"$in": list(quantities)}}, session=session
+            ) < len(quantities):
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="product out of stock",
+            )
+        products = {
+            x["_id"]: x
+            async for x in db.Product.find(
+                {"_id": {"$in": list(quantities)}},
+                {"price": 1, "category_id": 1},
+                session=session,
+            )
+        }
+        amounts = {k: v["price"] * quantities[k] for k, v in products.items()}
+        cost = sum(amounts.values())
+        order = await db.Order.find_one_and_update(
+            {"user_id": user_id, "status": OrderStatus.pending.value},
+            {"$inc": {"cost": cost}, "$set": {"updated_at": now}},
+            return_document=ReturnDocument.BEFORE,
+            session=session,
+        )
+        if not order:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+        before = await rollup.order_lines(db, [order], session)
+        # Lines written before quantities have none and are left alone.
+        await db.OrderProduct.bulk_write(
+            [
+                UpdateOne(
+                    {
+                        "order_id": order["_id"],
+                        "product_id": product_id,
+                        "quantity": {"$exists": True},
+                    },
+                    {"$inc": {"quantity": quantity}},
+                    upsert=True,
+                )
+                for product_id, quantity in quantities.items()
+            ],
+            ordered=False,
+            session=session,
+        )
+        await db[reservations].bulk_write(
+            [
+                UpdateOne(
+                    {"order_id": order["_id"], "product_id": product_id},
+                    {
+                        "$inc": {
+                            "quantity": quantity,
+                            "amount": amounts[product_id],
+                        },
+                        "$set": {
+                            "expires_at": now + timedelta(seconds=ttl_sec)
+                        },
+                    },
+                    upsert=True,
+                )
+                for product_id, quantity in quantities.items()
+            ],
+            ordered=False,
+            session=session,
+        )
+        order = {
+            **order,
+            "cost": (order.get("cost") or 0.0) + cost,
+            "updated_at": now,
+        }
+        after = rollup.restamp(before, order["status"], now) + [
+            rollup.order_line(order, products[product_id], quantity)
+            for product_id, quantity in quantities.items()
+        ]
+        return order, before, after
+
+    async with await db.client.start_session() as session:
+        order, before, after = await session.with_transaction(transaction)
+    await track(db, before, after)
+    return order
+
+
+async def return_stock(db: Database, units: Counter, session) -> None:
+    """Put back the stock of `units`, one update per product."""
+    if units:
+        await db.Product.bulk_write(
+            [
+                UpdateOne({"_id": product_id}, {"$inc": {"stock": n}})
+                for product_id, n in units.items()
+            ],
+            ordered=False,
+            session=session,
+        )
+
+
+def lines_cost(
+    units: Counter,
+    reserved: dict[ObjectId, dict[str, Any]],
+    prices: dict[ObjectId, float],
+) -> float:
+    """What `units` of products added the order cost: the amount of their
+    reservation at the price they were added at, and the current price for
+    the units it does not cover, such as lines written before
+    reservations."""
+    cost = 0.0
+    for product_id, quantity in units.items():
+        reservation = reserved.get(product_id, {})
+        unreserved = quantity - reservation.get("quantity", 0)
+        cost += reservation.get("amount", 0.0)
+        cost += max(unreserved, 0) * prices.get(product_id, 0.0)
+    return cost
+
+
+async def remove_lines(
+    db: Database,
+    order_id: ObjectId,
+    product_ids: list[ObjectId],
+    now: datetime,
+    session,
+) -> tuple[int, list[dict[str, Any]], list[dict[str, Any]]]:
+    """Delete the lines of `product_ids` from an order with their
+    reservations, returning their stock and taking their price off the order
+    cost. The reservations go even when their line is already gone. Returns
+    the removed quantity and the order lines before and after."""
+    match = {"order_id": order_id, "product_id": {"$in": product_ids}}
+    reserved = {
+        x["product_id"]: x
+        async for x in db[reservations].find(match, session=session)
+    }
+    await db[reservations].delete_many(match, session=session)
+    lines = await db.OrderProduct.find(
+        match, {"product_id": 1, "quantity": 1}, session=session
+    ).to_list(length=None)
+    units = line_units(lines)
+    order = await db.Order.find_one({"_id": order_id}, session=session)
+    if not units or not order:
+        return 0, [], []
+    before = await rollup.order_lines(db, [order], session)
+    prices = {
+        x["_id"]: x["price"]
+        async for x in db.Product.find(
+            {"_id": {"$in": list(units)}}, {"price": 1}, session=session
+        )
+    }
+    cost = lines_cost(units, reserved, prices)
+    await db.OrderProduct.delete_many(match, session=session)
+    await return_stock(db, units, session)
+    await db.Order.update_one(
+        {"_id": order_id},
+        {"$inc": {"cost": -cost}, "$set": {"updated_at": now}},
+        session=session,
+    )
+    after = rollup.restamp(
+        [x for x in before if x["product_id"] not in units],
+        order["status"],
+        now,
+    )
+    return sum(units.values()), before, after
+
+
+async def remove_products(
+    db: Database, order_id: str, product_ids: list[str]
+) -> int:
+    """`remove_lines` in a transaction of its own."""
+    now = datetime.utcnow()
+
+    async def transaction(session) -> tuple[int, list, list]:
+        return await remove_lines(
+            db,
+            ObjectId(order_id),
+            [ObjectId(x) for x in product_ids],
+            now,
+            session,
+        )
+
+    async with await db.client.start_session() as session:
+        removed, before, after = await session.with_transaction(transaction)
+    await track(db, before, after)
+    return removed
+
+
+async def release_order(db: Database, user_id: str, order_id: str) -> bool:
+    """Drop a cart of `user_id`: move it to `deleted` and return the stock
+    of its lines in a single transaction. The filter carries the shard key
+    of `Order`, which `findAndModify` needs on a sharded collection.
+    Returns whether the order was still `pending`."""
+    now = datetime.utcnow()
+
+    async def transaction(session) -> list[dict[str, Any]] | None:
+        order = await db.Order.find_one_and_update(
+            {
+                "_id": ObjectId(order_id),
+                "user_id": user_id,
+                "status": OrderStatus.pending.value,
+            },
+            {"$set": {"status": OrderStatus.deleted.value, "updated_at": now}},
+            return_document=ReturnDocument.BEFORE,
+            session=session,
+        )
+        if not order:
+            return None
+        before = await rollup.order_lines(db, [order], session)
+        lines = await db.OrderProduct.find(
+            {"order_id": order["_id"]},
+            {"product_id": 1, "quantity": 1},
+            session=session,
+        ).to_list(length=None)
+        await db[reservations].delete_many(
+            {"order_id": order["_id"]}, session=session
+        )
+        await return_stock(db, line_units(lines), session)
+        return before
+
+    async with await db.client.start_session() as session:
+        before = await session.with_transaction(transaction)
+    if before is None:
+        return False
+    await track(
+        db, before, rollup.restamp(before, OrderStatus.deleted.value, now)
+    )
+    return True
+
+
+async def set_status(
+    db: Database, order_id: str, target: OrderStatus, sources: list[str]
+) -> dict[str, Any] | None:
+    """Move an order whose status is one of `sources` to `target` and, when
+    it leaves `pending`, drop its reservations in the same transaction: its
+    stock stays taken and the sweeper can no longer expire its lines. The
+    order is read first for its `user_id`, the shard key `findAndModify`
+    needs on a sharded `Order`. Returns the updated order, `None` if there
+    is no such order."""
+    now = datetime.utcnow()
+
+    async def transaction(session) -> tuple[dict[str, Any] | None, list]:
+        current = await db.Order.find_one(
+            {"_id": ObjectId(order_id)},
+            {"user_id": 1, "status": 1},
+            session=session,
+        )
+        if not current:
+            return None, []
+        order = await db.Order.find_one_and_update(
+            {
+                "_id": current["_id"],
+                "user_id": current["user_id"],
+                "status": {"$in": sources},
+            },
+            {"$set": {"status": target.value, "updated_at": now}},
+            return_document=ReturnDocument.BEFORE,
+            session=session,
+        )
+        if not order:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"status {current['status']} cannot move to {target.name}",
+            )
+        if target != OrderStatus.pending:
+            await db[reservations].delete_many(
+                {"order_id": order["_id"]}, session=session
+            )
+        before = await rollup.order_lines(db, [order], session)
+        return {**order, "status": target.value, "updated_at": now}, before
+
+    if not ObjectId.is_valid(order_id):
+        return None
+    async with await db.client.start_session() as session:
+        order, before = await session.with_transaction(transaction)
+    if order:
+        await track(db, before, rollup.restamp(before, target.value, now))
+    return order
+
+
+async def release_reservations(
+    db: Database,
+    order_id: ObjectId,
+    product_ids: list[ObjectId],
+    now: datetime,
+) -> int:
+    """Release the reservations of `product_ids` that are still expired at
+    `now`, re-read in the transaction: one refreshed by a later add to the
+    cart is kept, and one of an order that left `pending` is dropped while
+    its stock stays taken. Returns the number of released reservations."""
+    match = {
+        "order_id": order_id,
+        "product_id": {"$in": product_ids},
+        "expires_at": {"$lt": now},
+    }
+
+    async def transaction(session) -> tuple[int, list, list]:
+        expired = [
+            x["product_id"]
+            async for x in db[reservations].find(
+                match, {"product_id": 1}, session=session
+            )
+        ]
+        if not expired:
+            return 0, [], []
+        if not await db.Order.count_documents(
+            {"_id": order_id, "status": OrderStatus.pending.value},
+            session=session,
+        ):
+            await db[reservations].delete_many(match, session=session)
+            return 0, [], []
+        _, before, after = await remove_lines(
+            db, order_id, expired, now, session
+        )
+        return len(expired), before, after
+
+    async with await db.client.start_session() as session:
+        released, before, after = await session.with_transaction(transaction)
+    await track(db, before, after)
+    return released
+
+
+def products_by_order(
+    reservations_: list[dict[str, Any]]
+) -> dict[ObjectId, list[ObjectId]]:
+    """Products of `reservations_` per order, in the order they come."""
+    products = defaultdict(list)
+    for x in reservations_:
+        products[x["order_id"]].append(x["product_id"])
+    return products
+
+
+async def release_expired(db: Database, batch_size: int) -> int:
+    """Remove the products of up to `batch_size` expired reservations from
+    their carts and return their stock. The ones refreshed in between are
+    kept and the others released or dropped, so none is found again.
+    Returns the number of released reservations."""
+    now = datetime.utcnow()
+    expired = (
+        await db[reservations]
+        .find(
+            {"expires_at": {"$lt": now}},
+            {"order_id": 1, "product_id": 1},
+            limit=batch_size,
+        )
+        .to_list(length=None)
+    )
+    released = 0
+    for order_id, product_ids in products_by_order(expired).items():
+        released += await release_reservations(db, order_id, product_ids, now)
+    return released
+
+
+async def sweep(db: Database, *, interval_sec: float, batch_size: int) -> None:
+    """Release expired reservations forever, batch after batch."""
+    while True:
+        while await release_expired(db, batch_size) == batch_size:
+            pass
+        await asyncio.sleep(interval_sec)
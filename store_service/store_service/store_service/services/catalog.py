@@ -0,0 +1,87 @@
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from pymongo.database import Database
+
+from store_service.api.api_v1.dependencies.params import (
+    RequestParams,
+    mongo_filter,
+)
+from store_service.core.config import get_app_settings
+from store_service.services.cache import TTLCache
+
+catalog_cache = TTLCache(
+    maxsize=get_app_settings().CATALOG_CACHE_MAXSIZE,
+    ttl=get_app_settings().CATALOG_CACHE_TTL_SEC,
+)
+
+# Category name -> id, filled by listings and category creation and cleared
+# by category updates and deletes in this process; the TTL bounds how long
+# renames made through other workers go unnoticed.
+category_ids = TTLCache(
+    maxsize=get_app_settings().CATALOG_CACHE_MAXSIZE,
+    ttl=get_app_settings().CATALOG_CATEGORY_IDS_TTL_SEC,
+)
+
+
+def catalog_key(
+    endpoint: str, request_params: RequestParams | None = None, **kwargs: Any
+) -> tuple:
+    return (
+        endpoint,
+        request_params.json(sort_keys=True) if request_params else None,
+        *sorted(kwargs.items()),
+    )
+
+
+async def cached(key: tuple, compute: Callable[[], Awaitable[Any]]) -> Any:
+    """Read-through: the cached value of `key`, or the result of `compute`.
+    Product stock changed by carts is only refreshed by the TTL."""
+    value, _, _ = await catalog_cache.get_or_compute(key, compute)
+    return value
+
+
+# Case-insensitive collation of `Product_title_ci_idx`: a title prefix is
+# the range from `q` up to `q` followed by U+FFFF, which ICU collates after
+# every other character, so autocomplete reads only the matching index keys.
+title_collation = {"locale": "en", "strength": 2}
+
+
+def search_query(
+    q: str, request_params: RequestParams, *, prefix: bool = False
+) -> dict[str, Any]:
+    """`find` arguments of `search_products`."""
+    if prefix:
+        query = {
+            "filter": {"title": {"$gte": q, "$lt": f"{q}\uffff"}},
+            "projection": None,
+            "sort": [("title", 1)],
+            "collation": title_collation,
+        }
+    else:
+        query = {
+            "filter": {"$text": {"$search": q}},
+            "projection": {"score": {"$meta": "textScore"}},
+            "sort": [("score", {"$meta": "textScore"}), ("_id", 1)],
+        }
+    query["filter"].update(mongo_filter(request_params.where))
+    return {
+        **query,
+        "skip": request_params.skip or 0,
+        "limit": request_params.take or 0,
+    }
+
+
+async def search_products(
+    db: Database,
+    q: str,
+    request_params: RequestParams,
+    *,
+    prefix: bool = False,
+) -> list[dict[str, Any]]:
+    """Products matching `q` ranked by relevance through the text index on
+    `title` and `description`, or with `prefix` the ones whose title starts
+    with `q` whatever its case, in title order, for autocomplete."""
+    return await db.Product.find(
+        **search_query(q, request_params, prefix=prefix)
+    ).to_list(length=None)
@@ -0,0 +1,127 @@
+from collections.abc import AsyncIterator
+from datetime import datetime
+from typing import Any
+
+from bson import ObjectId
+from fastapi import HTTPException
+from prisma.enums import OrderStatus
+from pymongo.database import Database
+from starlette import status
+
+from store_service.services.analytics import rollup
+from store_service.services.analytics.tracking import track
+
+# Back-office transitions. Carts (`pending`) are left to their owners and
+# `deleted` to `DELETE /orders/`, so neither appears here.
+transitions: dict[OrderStatus, set[OrderStatus]] = {
+    OrderStatus.awaiting_payment: {
+        OrderStatus.awaiting_fulfilment,
+        OrderStatus.canceled,
+        OrderStatus.declined,
+    },
+    OrderStatus.awaiting_fulfilment: {
+        OrderStatus.completed,
+        OrderStatus.canceled,
+    },
+    OrderStatus.completed: {
+        OrderStatus.refunded,
+        OrderStatus.partially_refunded,
+        OrderStatus.disputed,
+    },
+    OrderStatus.disputed: {
+        OrderStatus.completed,
+        OrderStatus.refunded,
+        OrderStatus.partially_refunded,
+    },
+    OrderStatus.partially_refunded: {OrderStatus.refunded},
+}
+
+# Checkout of a cart by its owner, one order at a time.
+cart_transitions: dict[OrderStatus, set[OrderStatus]] = {
+    OrderStatus.pending: {OrderStatus.awaiting_payment},
+}
+
+
+def sources(target: OrderStatus, *, carts: bool = False) -> list[str]:
+    """Statuses an order may move to `target` from, with `carts` also
+    through `cart_transitions`."""
+    table = {**transitions, **cart_transitions} if carts else transitions
+    sources = [k.value for k, v in table.items() if target in v]
+    if not sources:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"status {target.name} not allowed",
+        )
+    return sources
+
+
+async def iter_chunks(
+    db: Database,
+    ids: list[str] | None,
+    match: dict[str, Any],
+    chunk_size: int,
+) -> AsyncIterator[list[ObjectId]]:
+    if ids is not None:
+        if not all(map(ObjectId.is_valid, ids)):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="invalid order id",
+            )
+        for i in range(0, len(ids), chunk_size):
+            yield [ObjectId(x) for x in ids[i : i + chunk_size]]
+        return
+    chunk = []
+    async for x in db.Order.find(
+        match, {"_id": 1}, sort=[("_id", 1)], batch_size=chunk_size
+    ):
+        chunk.append(x["_id"])
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+async def update_status(
+    db: Database,
+    target: OrderStatus,
+    *,
+    ids: list[str] | None = None,
+    match: dict[str, Any] | None = None,
+    chunk_size: int,
+) -> list[dict[str, int]]:
+    """Move the orders `ids`, or the ones matching `match`, to `target`,
+    `chunk_size` orders per transaction. Orders whose current status cannot
+    move to `target` are skipped. Returns the counts per chunk."""
+    allowed = {"status": {"$in": sources(target)}}
+
+    async def move(session, chunk: list[ObjectId], now: datetime):
+        orders = await db.Order.find(
+            {"_id": {"$in": chunk}, **allowed}, session=session
+        ).to_list(length=None)
+        if orders:
+            await db.Order.update_many(
+                {"_id": {"$in": [x["_id"] for x in orders]}},
+                {"$set": {"status": target.value, "updated_at": now}},
+                session=session,
+            )
+        return len(orders), await rollup.order_lines(db, orders, session)
+
+    chunks = []
+    async with await db.client.start_session() as session:
+        async for chunk in iter_chunks(
+            db, ids, {**(match or {}), **allowed}, chunk_size
+        ):
+            now = datetime.utcnow()
+            modified, before = await session.with_transaction(
+                lambda s: move(s, chunk, now)
+            )
+            await track(db, before, rollup.restamp(before, target.value, now))
+            chunks.append(
+                {
+                    "requested": len(chunk),
+                    "modified": modified,
+                    "skipped": len(chunk) - modified,
+                }
+            )
+    return chunks
@@ -0,0 +1,247 @@
+import csv
+import json
+from collections.abc import AsyncIterable, AsyncIterator
+from datetime import datetime
+from typing import Any
+
+from bson import ObjectId
+from fastapi import HTTPException
+from prisma.partials import ProductCreate
+from pydantic import ValidationError
+from pymongo import UpdateOne
+from pymongo.database import Database
+from pymongo.errors import BulkWriteError
+from starlette import status
+
+from store_service.schemas.product import ImportFormat, ProductBulkUpdate
+from store_service.services.analytics.tracking import track_prices
+from store_service.services.catalog import catalog_cache
+
+DUPLICATE_KEY = 11000
+
+
+async def iter_lines(chunks: AsyncIterable[bytes]) -> AsyncIterator[str]:
+    """Lines of a streamed body, whatever the chunk boundaries."""
+    buffer = b""
+    async for chunk in chunks:
+        *lines, buffer = (buffer + chunk).split(b"\n")
+        for line in lines:
+            yield line.decode(errors="replace").rstrip("\r")
+    if buffer:
+        yield buffer.decode(errors="replace").rstrip("\r")
+
+
+async def iter_rows(
+    chunks: AsyncIterable[bytes], format_: ImportFormat
+) -> AsyncIterator[tuple[int, dict[str, Any] | None, str | None]]:
+    """`(row, fields, error)` of a CSV body with a header line or of an
+    NDJSON body, rows numbered from 1 without the header and blank lines.
+    CSV fields are one line each and empty ones are left out."""
+    header = None
+    row = 0
+    async for line in iter_lines(chunks):
+        if not line.strip():
+            continue
+        if format_ == ImportFormat.csv:
+            values = next(csv.reader([line]))
+            if header is None:
+                header = values
+                continue
+            row += 1
+            if len(values) != len(header):
+                yield row, None, f"expected {len(header)} fields"
+                continue
+            yield row, {k: v for k, v in zip(header, values) if v}, None
+            continue
+        row += 1
+        try:
+            fields = json.loads(line)
+        except ValueError as e:
+            yield row, None, str(e)
+            continue
+        if not isinstance(fields, dict):
+            yield row, None, "expected an object"
+            continue
+        yield row, fields, None
+
+
+def product_document(fields: dict[str, Any], now: datetime) -> dict[str, Any]:
+    """Validate `fields` with `ProductCreate` into a `Product` document."""
+    product = ProductCreate.parse_obj(fields)
+    if not ObjectId.is_valid(product.category_id):
+        raise ValueError("category_id: not an ObjectId")
+    return {
+        **product.dict(exclude_none=True),
+        "category_id": ObjectId(product.category_id),
+        "created_at": now,
+        "updated_at": now,
+    }
+
+
+def validation_detail(e: ValueError) -> str:
+    if isinstance(e, ValidationError):
+        return "; ".join(
+            f"{'.'.join(map(str, x['loc']))}: {x['msg']}" for x in e.errors()
+        )
+    return str(e)
+
+
+async def insert_batch(
+    db: Database, batch: list[tuple[int, dict[str, Any]]]
+) -> tuple[int, list[dict[str, Any]]]:
+    """Insert the documents of `batch` unordered, so a duplicate title only
+    fails its own row. Returns the inserted count and the failed rows."""
+    try:
+        result = await db.Product.insert_many(
+            [x for _, x in batch], ordered=False
+        )
+        return len(result.inserted_ids), []
+    except BulkWriteError as e:
+        errors = []
+        for error in e.details["writeErrors"]:
+            row, document = batch[error["index"]]
+            errors.append(
+                {
+                    "row": row,
+                    "title": document.get("title"),
+                    "detail": "duplicate title"
+                    if error["code"] == DUPLICATE_KEY
+                    else error["errmsg"],
+                }
+            )
+        return e.details["nInserted"], errors
+
+
+async def import_products(
+    db: Database,
+    chunks: AsyncIterable[bytes],
+    format_: ImportFormat,
+    batch_size: int,
+) -> dict[str, Any]:
+    """Insert the products of a streamed CSV or NDJSON body `batch_size` at
+    a time as the rows come in, reporting every row that failed validation
+    or insertion."""
+    inserted = 0
+    errors = []
+    batch = []
+    now = datetime.utcnow()
+    async for row, fields, error in iter_rows(chunks, format_):
+        if error is None:
+            try:
+                batch.append((row, product_document(fields, now)))
+            except ValueError as e:
+                error = validation_detail(e)
+        if error is not None:
+            title = (fields or {}).get("title")
+            errors.append(
+                {
+                    "row": row,
+                    "title": title if isinstance(title, str) else None,
+                    "detail": error,
+                }
+            )
+        if len(batch) >= batch_size:
+            n, failed = await insert_batch(db, batch)
+            inserted += n
+            errors.extend(failed)
+            batch = []
+    if batch:
+        n, failed = await insert_batch(db, batch)
+        inserted += n
+        errors.extend(failed)
+    errors.sort(key=lambda x: x["row"])
+    return {"inserted": inserted, "failed": len(errors), "errors": errors}
+
+
+def update_operations(
+    update: ProductBulkUpdate, now: datetime
+) -> list[UpdateOne]:
+    """`$set` of `price` and `stock`, and a separate atomic `$inc` of
+    `stock_delta` that only matches while the stock covers a negative delta,
+    so a failed stock guard does not drop the price change."""
+    if not ObjectId.is_valid(update.id):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"invalid product id {update.id}",
+        )
+    if update.stock is not None and update.stock_delta is not None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"either stock or stock_delta for product {update.id}",
+        )
+    match = {"_id": ObjectId(update.id)}
+    values = update.dict(include={"price", "stock"}, exclude_none=True)
+    operations = []
+    if values:
+        operations.append(
+            UpdateOne(match, {"$set": {**values, "updated_at": now}})
+        )
+    if update.stock_delta:
+        guard = {}
+        if update.stock_delta < 0:
+            guard = {"stock": {"$gte": -update.stock_delta}}
+        operations.append(
+            UpdateOne(
+                {**match, **guard},
+                {
+                    "$inc": {"stock": update.stock_delta},
+                    "$set": {"updated_at": now},
+                },
+            )
+        )
+    if not operations:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"nothing to update for product {update.id}",
+        )
+    return operations
+
+
+async def product_prices(db: Database, ids: list[str]) -> dict[str, float]:
+    """Current price of the products of `ids`, invalid ids left out."""
+    return {
+        str(x["_id"]): x["price"]
+        async for x in db.Product.find(
+            {
+                "_id": {
+                    "$in": [ObjectId(x) for x in ids if ObjectId.is_valid(x)]
+                }
+            },
+            {"price": 1},
+        )
+    }
+
+
+async def update_products(
+    db: Database, updates: list[ProductBulkUpdate], chunk_size: int
+) -> list[dict[str, int]]:
+    """Apply `updates` as unordered `bulk_write` operations, `chunk_size`
+    per chunk, invalidating the catalog cache once per chunk that changed
+    a product, then move the sales rollup to the new prices. Returns the
+    counts per chunk."""
+    now = datetime.utcnow()
+    operations = [y for x in updates for y in update_operations(x, now)]
+    prices = {x.id: x.price for x in updates if x.price is not None}
+    old_prices = await product_prices(db, list(prices))
+    chunks = []
+    for i in range(0, len(operations), chunk_size):
+        chunk = operations[i : i + chunk_size]
+        result = await db.Product.bulk_write(chunk, ordered=False)
+        if result.modified_count:
+            catalog_cache.invalidate()
+        chunks.append(
+            {
+                "operations": len(chunk),
+                "matched": result.matched_count,
+                "modified": result.modified_count,
+            }
+        )
+    await track_prices(
+        db,
+        {
+            ObjectId(k): (v, prices[k])
+            for k, v in old_prices.items()
+            if v != prices[k]
+        },
+    )
+    return chunks
@@ -0,0 +1,86 @@
+from types import SimpleNamespace
+
+import pytest
+
+from store_service.services.analytics.columnar import OrderLines
+
+
+def test_order_lines_group():
+    order_lines = OrderLines(
+        product_ids=["p1", "p2", "p1", "p1"],
+        category_ids=["c1", "c2", "c1", "c1"],
+        order_ids=["o1", "o1", "o2", "o2"],
+        user_ids=["u1", "u1", "u2", "u2"],
+        prices=[10.0, 5.0, 10.0, 10.0],
+    )
+    assert order_lines.revenue == 35.0
+    assert order_lines.order_count == 2
+
+    products = {
+        x["id"]: x
+        for x in order_lines.group(
+            "product", with_orders=True, with_buyers=True
+        )
+    }
+    assert len(products) == 2
+    assert products["p1"]["revenue"] == 30.0
+    assert products["p1"]["units"] == 3
+    assert products["p1"]["order_count"] == 2
+    assert products["p1"]["orders"] == ["o1", "o2"]
+    assert products["p1"]["buyers"] == ["u1", "u2"]
+    assert products["p2"]["buyers"] == ["u1"]
+
+    categories = {x["id"]: x for x in order_lines.group("category")}
+    assert categories["c2"]["order_count"] == 1
+    assert categories["c1"]["orders"] is None
+
+
+def test_order_lines_quantities():
+    order_lines = OrderLines(
+        product_ids=["p1", "p2"],
+        category_ids=["c1", "c1"],
+        order_ids=["o1", "o1"],
+        user_ids=["u1", "u1"],
+        prices=[10.0, 5.0],
+        quantities=[3, 1],
+    )
+    assert order_lines.revenue == 35.0
+    (category,) = order_lines.group("category")
+    assert category["revenue"] == 35.0
+    assert category["units"] == 4
+
+
+def test_order_lines_empty():
+    order_lines = OrderLines([], [], [], [], [])
+    assert order_lines.group("product") == []
+    assert order_lines.revenue == 0.0
+
+
+@pytest.mark.asyncio
+async def test_order_lines_from_chunks():
+    def line(product_id, order_id, user_id, price):
+        return SimpleNamespace(
+            product=SimpleNamespace(
+                id=product_id, category_id="c1", price=price
+            ),
+            order=SimpleNamespace(user_id=user_id),
+            order_id=order_id,
+            quantity=None,
+        )
+
+    lines = [
+        line("p1", "o1", "u1", 10.0),
+        line("p2", "o1", "u1", 5.0),
+        SimpleNamespace(product=None),
+        line("p1", "o2", "u2", 10.0),
+    ]
+
+    async def chunks():
+        yield lines[:2]
+        yield lines[2:]
+
+    order_lines = await OrderLines.from_chunks(chunks())
+    assert len(order_lines) == 3
+    assert order_lines.group("product") == OrderLines.from_order_products(
+        lines
+    ).group("product")
@@ -0,0 +1,62 @@
+import io
+from datetime import datetime
+
+import pyarrow as pa
+import pyarrow.csv
+import pyarrow.ipc
+import pyarrow.parquet
+import pytest
+from bson import ObjectId
+
+from store_service.schemas.analytic import ExportFormat
+from store_service.services.analytics.export import (
+    encode,
+    record_batch,
+    schema,
+)
+
+lines = [
+    {
+        "order_id": ObjectId(),
+        "user_id": f"u{i}",
+        "status": "completed",
+        "updated_at": datetime(2023, 1, 1),
+        "product_id": ObjectId(),
+        "category_id": ObjectId() if i % 3 else None,
+        "price": float(i),
+        "quantity": i % 2 + 1,
+    }
+    for i in range(10)
+]
+
+
+async def batches():
+    for i in range(0, len(lines), 4):
+        yield record_batch(lines[i : i + 4])
+
+
+async def read(format_: ExportFormat) -> tuple[int, pa.Table]:
+    parts = [x async for x in encode(batches(), format_)]
+    data = b"".join(parts)
+    if format_ == ExportFormat.parquet:
+        table = pa.parquet.read_table(io.BytesIO(data))
+    elif format_ == ExportFormat.arrow:
+        table = pa.ipc.open_stream(data).read_all()
+    else:
+        table = pa.csv.read_csv(
+            io.BytesIO(data),
+            convert_options=pa.csv.ConvertOptions(
+                column_types=schema, strings_can_be_null=True
+            ),
+        )
+    return len(parts), table
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("format_", list(ExportFormat))
+async def test_encode(format_):
+    part_count, table = await read(format_)
+    assert part_count > 1
+    assert table.num_rows == len(lines)
+    assert table.column("order_id").to_pylist()[0] == str(lines[0]["order_id"])
+    assert table.column("category_id").null_count == 4
@@ -0,0 +1,18 @@
+from store_service.services.analytics.hll import HyperLogLog, RELATIVE_ERROR
+
+
+def test_hyperloglog_count():
+    for n in [10, 1000, 50000]:
+        sketch = HyperLogLog(f"user-{i}" for i in range(n))
+        assert abs(sketch.count() - n) <= 4 * RELATIVE_ERROR * n + 1
+
+
+def test_hyperloglog_merge():
+    a = HyperLogLog(f"user-{i}" for i in range(0, 6000))
+    b = HyperLogLog(f"user-{i}" for i in range(4000, 10000))
+    merged = HyperLogLog.from_document(a.to_document()).merge(b)
+    assert abs(merged.count() - 10000) <= 4 * RELATIVE_ERROR * 10000
+    assert (
+        merged.registers
+        == HyperLogLog(f"user-{i}" for i in range(10000)).registers
+    )
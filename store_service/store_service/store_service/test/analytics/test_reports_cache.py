@@ -0,0 +1,21 @@
+from datetime import datetime
+
+from store_service.api.api_v1.dependencies.params import RequestParams
+from store_service.services.analytics.cache import report_key, report_touched
+
+
+def test_report_touched():
+    params = RequestParams(where={"status": {"in": ["completed"]}})
+    key = report_key(
+        "sales",
+        params,
+        start_datetime=datetime(2024, 1, 1, 12),
+        end_datetime=datetime(2024, 2, 1),
+    )
+    assert report_touched(key, {("completed", datetime(2024, 1, 1, 6))})
+    assert not report_touched(key, {("canceled", datetime(2024, 1, 5))})
+    assert not report_touched(key, {("completed", datetime(2024, 2, 2))})
+    assert report_touched(
+        report_key("sales", RequestParams(), **dict(key[2:])),
+        {("pending", datetime(2024, 1, 5))},
+    )
@@ -0,0 +1,79 @@
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+
+from store_service.api.api_v1.dependencies.params import RequestParams
+from store_service.services.analytics.rollup import (
+    counters,
+    order_line,
+    reprice_operations,
+    restamp,
+    rollup_match,
+)
+
+
+def test_lines_moved_to_another_status_and_day():
+    order = {
+        "_id": ObjectId(),
+        "user_id": "u1",
+        "status": "pending",
+        "updated_at": datetime(2024, 1, 1, 10),
+    }
+    product = {"_id": ObjectId(), "category_id": ObjectId(), "price": 2.5}
+    before = [order_line(order, product, 4)]
+    after = restamp(before, "awaiting_payment", datetime(2024, 1, 2, 9))
+    assert before[0]["amount"] == 10.0
+    assert before[0]["day"] == datetime(2024, 1, 1)
+    old, new = counters(before), counters(after)
+    day_total = (datetime(2024, 1, 2), "awaiting_payment", None, None)
+    assert new[day_total]["revenue"] == 10.0
+    assert new[day_total]["units"] == 4
+    assert (datetime(2024, 1, 1), "pending", None, None) in old
+    assert not old.keys() & new.keys()
+
+
+def test_reprice_moves_the_revenue_of_every_row_of_a_line():
+    product = {"_id": ObjectId(), "category_id": ObjectId()}
+    group = {
+        "_id": {"day": datetime(2024, 1, 1), "status": "pending"},
+        "units": 3,
+        "updated_at": datetime(2024, 1, 1, 10),
+    }
+    operations = reprice_operations(product, 10.0, group)
+    assert [x._filter for x in operations] == [
+        {
+            "day": datetime(2024, 1, 1),
+            "status": "pending",
+            "category_id": product["category_id"],
+            "product_id": product["_id"],
+        },
+        {
+            "day": datetime(2024, 1, 1),
+            "status": "pending",
+            "category_id": product["category_id"],
+            "product_id": None,
+        },
+        {
+            "day": datetime(2024, 1, 1),
+            "status": "pending",
+            "category_id": None,
+            "product_id": None,
+        },
+    ]
+    assert all(x._doc == {"$inc": {"revenue": 30.0}} for x in operations)
+
+
+def test_rollup_match_rejects_a_range():
+    start, end = datetime(2024, 1, 1, 10), datetime(2024, 1, 3, 12)
+    match = rollup_match(
+        start, end, RequestParams(skip=0, where={"status": "completed"})
+    )
+    assert match == {
+        "day": {"$gte": datetime(2024, 1, 1), "$lt": end},
+        "status": "completed",
+    }
+    for request_params in (RequestParams(take=50), RequestParams(skip=5)):
+        with pytest.raises(HTTPException):
+            rollup_match(start, end, request_params)
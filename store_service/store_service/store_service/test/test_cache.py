@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+from store_service.services.cache import TTLCache
+
+
+@pytest.mark.asyncio
+async def test_ttl_cache_computes_once():
+    cache = TTLCache(maxsize=2, ttl=60)
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "report"
+
+    results = await asyncio.gather(
+        *[cache.get_or_compute("key", compute) for _ in range(5)]
+    )
+    assert len(calls) == 1
+    assert [x[0] for x in results] == ["report"] * 5
+    assert sum(x[1] for x in results) == 4
+    assert cache.stats()["hits"] == 4
+
+
+@pytest.mark.asyncio
+async def test_ttl_cache_eviction_and_invalidation():
+    cache = TTLCache(maxsize=2, ttl=60)
+    for key in ["a", "b", "c"]:
+        cache.set(key, key)
+    assert cache.get("a") is None
+    assert cache.get("c")[0] == "c"
+    assert cache.evictions == 1
+
+    cache.ttl = 0
+    assert cache.get("b") is None
+
+    cache.ttl = 60
+    cache.set("d", "d")
+    assert cache.invalidate() == 2
+    assert len(cache) == 0
+
+
+@pytest.mark.asyncio
+async def test_ttl_cache_drops_unused_locks():
+    cache = TTLCache(maxsize=2, ttl=60)
+
+    async def compute():
+        await asyncio.sleep(0.01)
+        return "report"
+
+    async def fail():
+        raise ValueError
+
+    await asyncio.gather(
+        *[cache.get_or_compute("a", compute) for _ in range(3)]
+    )
+    with pytest.raises(ValueError):
+        await cache.get_or_compute("b", fail)
+    pending = asyncio.ensure_future(cache.get_or_compute("c", compute))
+    await asyncio.sleep(0)
+    cache.invalidate()
+    assert list(cache._locks) == ["c"]
+    assert await pending == ("report", False, 0.0)
+    assert cache._locks == {}
+    assert cache.get("c") is None
+
+
+@pytest.mark.asyncio
+async def test_ttl_cache_invalidates_matching_keys():
+    cache = TTLCache(maxsize=4, ttl=60)
+    for key in ["a1", "a2", "b1"]:
+        cache.set(key, key)
+
+    async def compute():
+        await asyncio.sleep(0.01)
+        return "value"
+
+    pending = [
+        asyncio.ensure_future(cache.get_or_compute(key, compute))
+        for key in ["a3", "b2"]
+    ]
+    await asyncio.sleep(0)
+    assert cache.invalidate(lambda key: key.startswith("a")) == 2
+    await asyncio.gather(*pending)
+    assert cache.get("a3") is None
+    assert cache.get("b1")[0] == "b1"
+    assert cache.get("b2")[0] == "value"
@@ -0,0 +1,118 @@
+from collections import Counter
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+
+from store_service.services import cart
+
+
+def test_line_units_of_legacy_lines():
+    a, b = ObjectId(), ObjectId()
+    units = cart.line_units(
+        [
+            {"product_id": a, "quantity": 3},
+            {"product_id": b},
+            {"product_id": b, "quantity": None},
+            {"product_id": None, "quantity": 2},
+        ]
+    )
+    assert units == Counter({a: 3, b: 2})
+
+
+def test_lines_cost_from_reserved_amounts():
+    a, b, c = ObjectId(), ObjectId(), ObjectId()
+    cost = cart.lines_cost(
+        Counter({a: 2, b: 3, c: 1}),
+        {
+            a: {"quantity": 2, "amount": 20.0},
+            b: {"quantity": 1, "amount": 5.0},
+        },
+        {a: 15.0, b: 7.0, c: 4.0},
+    )
+    # `a` at its reserved price, `b` partly at the current one, `c` unreserved.
+    assert cost == 20.0 + 5.0 + 2 * 7.0 + 4.0
+    assert cart.lines_cost(Counter({a: 1}), {}, {}) == 0.0
+
+
+@pytest.mark.asyncio
+async def test_release_expired_per_order(monkeypatch):
+    o1, o2 = ObjectId(), ObjectId()
+    p1, p2, p3 = ObjectId(), ObjectId(), ObjectId()
+    expired = [
+        {"order_id": o1, "product_id": p1},
+        {"order_id": o2, "product_id": p2},
+        {"order_id": o1, "product_id": p3},
+    ]
+    queries = []
+    released = []
+
+    class Cursor:
+        async def to_list(self, length):
+            return expired
+
+    class Collection:
+        def find(self, filter_, projection, limit):
+            queries.append((filter_, limit))
+            return Cursor()
+
+    async def release_reservations(db, order_id, product_ids, now):
+        released.append((order_id, product_ids))
+        return len(product_ids) - 1
+
+    monkeypatch.setattr(cart, "release_reservations", release_reservations)
+    assert (
+        await cart.release_expired({cart.reservations: Collection()}, 3) == 1
+    )
+    assert queries[0][1] == 3
+    assert released == [(o1, [p1, p3]), (o2, [p2])]
+
+
+@pytest.mark.asyncio
+async def test_release_reservations_of_an_order_no_longer_pending(
+    monkeypatch,
+):
+    order_id, product_id = ObjectId(), ObjectId()
+    deleted = []
+
+    class Session:
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *args):
+            pass
+
+        async def with_transaction(self, callback):
+            return await callback(self)
+
+    class Client:
+        async def start_session(self):
+            return Session()
+
+    class Reservations:
+        async def find(self, filter_, projection, session):
+            yield {"product_id": product_id}
+
+        async def delete_many(self, filter_, session):
+            deleted.append(filter_)
+
+    class Orders:
+        async def count_documents(self, filter_, session):
+            return 0
+
+    class Database(dict):
+        client = Client()
+        Order = Orders()
+
+    async def remove_lines(*args):
+        raise AssertionError("the lines of a checked out order are kept")
+
+    monkeypatch.setattr(cart, "remove_lines", remove_lines)
+    released = await cart.release_reservations(
+        Database({cart.reservations: Reservations()}),
+        order_id,
+        [product_id],
+        datetime.utcnow(),
+    )
+    assert released == 0
+    assert deleted[0]["order_id"] == order_id
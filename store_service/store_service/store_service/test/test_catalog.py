@@ -0,0 +1,27 @@
+from store_service.api.api_v1.dependencies.params import RequestParams
+from store_service.services.catalog import search_query, title_collation
+
+
+def test_search_query_ranks_by_text_score():
+    query = search_query(
+        "desk lamp", RequestParams(skip=10, take=5, where={"stock": {"gt": 0}})
+    )
+    assert query == {
+        "filter": {"$text": {"$search": "desk lamp"}, "stock": {"$gt": 0}},
+        "projection": {"score": {"$meta": "textScore"}},
+        "sort": [("score", {"$meta": "textScore"}), ("_id", 1)],
+        "skip": 10,
+        "limit": 5,
+    }
+
+
+def test_search_query_prefix_is_an_index_range():
+    query = search_query("iPh", RequestParams(), prefix=True)
+    assert query == {
+        "filter": {"title": {"$gte": "iPh", "$lt": "iPh\uffff"}},
+        "projection": None,
+        "sort": [("title", 1)],
+        "collation": title_collation,
+        "skip": 0,
+        "limit": 0,
+    }
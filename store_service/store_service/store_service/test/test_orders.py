@@ -0,0 +1,23 @@
+import pytest
+from fastapi import HTTPException
+from prisma.enums import OrderStatus
+
+from store_service.services.orders import sources
+
+
+def test_sources_of_checkout_only_for_carts():
+    assert sources(OrderStatus.awaiting_payment, carts=True) == [
+        OrderStatus.pending.value
+    ]
+    assert set(sources(OrderStatus.refunded)) == {
+        OrderStatus.completed.value,
+        OrderStatus.disputed.value,
+        OrderStatus.partially_refunded.value,
+    }
+    for target, carts in [
+        (OrderStatus.awaiting_payment, False),
+        (OrderStatus.deleted, True),
+        (OrderStatus.pending, True),
+    ]:
+        with pytest.raises(HTTPException):
+            sources(target, carts=carts)
@@ -0,0 +1,21 @@
+from bson import ObjectId
+
+from store_service.api.api_v1.dependencies.params import mongo_filter
+
+
+def test_mongo_filter_converts_object_ids():
+    ids = [str(ObjectId()) for _ in range(3)]
+    assert mongo_filter(
+        {
+            "id": ids[0],
+            "category_id": {"in": ids[1:]},
+            "user_id": ids[0],
+            "status": "completed",
+        }
+    ) == {
+        "_id": ObjectId(ids[0]),
+        "category_id": {"$in": [ObjectId(x) for x in ids[1:]]},
+        "user_id": ids[0],
+        "status": "completed",
+    }
+    assert mongo_filter({"id": "not-an-id"}) == {"_id": "not-an-id"}
@@ -0,0 +1,76 @@
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+
+from store_service.schemas.product import ImportFormat, ProductBulkUpdate
+from store_service.services.products import iter_rows, update_operations
+
+
+async def stream(*chunks: bytes):
+    for chunk in chunks:
+        yield chunk
+
+
+async def rows(format_: ImportFormat, *chunks: bytes) -> list:
+    return [x async for x in iter_rows(stream(*chunks), format_)]
+
+
+@pytest.mark.asyncio
+async def test_csv_rows_across_chunks():
+    assert await rows(
+        ImportFormat.csv,
+        b"title,price,description\r\n",
+        b'Lamp,10.5,"warm, white"\r\nDe',
+        b"sk,99,\n\nChair,1\n",
+    ) == [
+        (
+            1,
+            {"title": "Lamp", "price": "10.5", "description": "warm, white"},
+            None,
+        ),
+        (2, {"title": "Desk", "price": "99"}, None),
+        (3, None, "expected 3 fields"),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_ndjson_rows():
+    assert await rows(
+        ImportFormat.ndjson,
+        b'{"title": "Lamp", "stock": 1}\n',
+        b"[1]\n{oops\n",
+    ) == [
+        (1, {"title": "Lamp", "stock": 1}, None),
+        (2, None, "expected an object"),
+        (
+            3,
+            None,
+            "Expecting property name enclosed in double quotes: line 1 column 2 (char 1)",
+        ),
+    ]
+
+
+def test_update_operations():
+    now = datetime(2024, 1, 1)
+    id_ = str(ObjectId())
+    [set_] = update_operations(
+        ProductBulkUpdate(id=id_, price=5, stock=3), now
+    )
+    assert set_._filter == {"_id": ObjectId(id_)}
+    assert set_._doc == {"$set": {"price": 5, "stock": 3, "updated_at": now}}
+    price, inc = update_operations(
+        ProductBulkUpdate(id=id_, price=7, stock_delta=-2), now
+    )
+    assert price._filter == {"_id": ObjectId(id_)}
+    assert price._doc == {"$set": {"price": 7, "updated_at": now}}
+    assert inc._filter == {"_id": ObjectId(id_), "stock": {"$gte": 2}}
+    assert inc._doc == {"$inc": {"stock": -2}, "$set": {"updated_at": now}}
+    for update in (
+        ProductBulkUpdate(id="x", price=1),
+        ProductBulkUpdate(id=id_, stock=1, stock_delta=1),
+        ProductBulkUpdate(id=id_),
+    ):
+        with pytest.raises(HTTPException):
+            update_operations(update, now)